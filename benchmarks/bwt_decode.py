@@ -0,0 +1,49 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "Benchmark of the BWT decoders on skewed (low entropy) inputs"
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bwt import bwt_decode, bwt_decode_naive, bwt_encode_with_sais
+
+
+def generate_skewed_string(length: int, dominant_ratio: float, rng: random.Random) -> str:
+    """
+    Generate a string where one character makes up dominant_ratio of the text and the rest is spread over a few others.
+    """
+    others = "bcdefgh"
+    return "".join("a" if rng.random() < dominant_ratio else rng.choice(others) for _ in range(length))
+
+
+def time_decoder(decoder, bwt_text: str, expected: str) -> float:
+    start = time.perf_counter()
+    decoded = decoder(bwt_text)
+    elapsed = time.perf_counter() - start
+
+    assert decoded == expected, "decoder returned a different text"
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare bwt_decode (LF array) with bwt_decode_naive (get_order)")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.5, 0.9, 0.99])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'length':>8} {'dominant':>9} {'naive (s)':>10} {'lf (s)':>10} {'speedup':>8}")
+    for length in args.lengths:
+        for ratio in args.ratios:
+            text = generate_skewed_string(length, ratio, rng)
+            bwt_text = bwt_encode_with_sais(text)
+
+            naive_time = time_decoder(bwt_decode_naive, bwt_text, text)
+            lf_time = time_decoder(bwt_decode, bwt_text, text)
+            print(f"{length:>8} {ratio:>9.2f} {naive_time:>10.4f} {lf_time:>10.4f} {naive_time / lf_time:>7.1f}x")
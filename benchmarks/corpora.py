@@ -0,0 +1,91 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "Reproducible benchmark corpora of different entropies"
+
+import random
+from typing import Callable
+
+WORDS = ("the of and to in is that it was for on are as with his they at be this from have or by one had not but "
+         "what all were when we there can an your which their said if do will each about how up out them then she "
+         "many some so these would other into has more her two like him see time could no make than first been its "
+         "who now people my made over did down only way find use may water long little very after words called just "
+         "where most know get through back much before go good new write our used me man too any day same right look "
+         "think also around another came come work three word must because does part even place well such").split()
+
+LOG_LEVELS = ("INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR")
+LOG_SERVICES = ("api", "auth", "billing", "search", "worker")
+LOG_PATHS = ("/v1/users", "/v1/orders", "/v1/search", "/v1/login", "/healthz")
+LOG_STATUSES = (200, 200, 200, 201, 204, 301, 404, 500)
+
+
+def generate_random(size: int, rng: random.Random) -> str:
+    """
+    Uniformly random printable ASCII: close to incompressible, the worst case for every stage.
+    """
+    return "".join(chr(rng.randint(32, 126)) for _ in range(size))
+
+
+def generate_english(size: int, rng: random.Random) -> str:
+    """
+    English-like text: common words with Zipf-like frequencies, punctuation and line breaks.
+    """
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    parts = []
+    n_chars = 0
+    while n_chars < size:
+        sentence = " ".join(rng.choices(WORDS, weights, k=rng.randint(5, 15)))
+        sentence = sentence[0].upper() + sentence[1:] + rng.choice((". ", ". ", "? ", "!\n", ".\n"))
+        parts.append(sentence)
+        n_chars += len(sentence)
+
+    return "".join(parts)[:size]
+
+
+def generate_repetitive(size: int, rng: random.Random) -> str:
+    """
+    A short motif repeated over and over with rare mutations: long runs after BWT, the best case for run lengths.
+    """
+    motif = [chr(rng.randint(97, 122)) for _ in range(rng.randint(20, 40))]
+    chars = []
+    while len(chars) < size:
+        if rng.random() < 0.05:
+            motif[rng.randrange(len(motif))] = chr(rng.randint(97, 122))
+        chars.extend(motif)
+
+    return "".join(chars[:size])
+
+
+def generate_log(size: int, rng: random.Random) -> str:
+    """
+    Log-like lines: a fixed structure with timestamps, ids and a few fields drawn from small vocabularies.
+    """
+    lines = []
+    n_chars = 0
+    timestamp = 1_700_000_000
+    while n_chars < size:
+        timestamp += rng.randint(0, 3)
+        line = (f"{timestamp} {rng.choice(LOG_LEVELS)} service={rng.choice(LOG_SERVICES)} "
+                f"path={rng.choice(LOG_PATHS)} status={rng.choice(LOG_STATUSES)} "
+                f"latency_ms={rng.randint(1, 999)} request_id={rng.getrandbits(32):08x}\n")
+        lines.append(line)
+        n_chars += len(line)
+
+    return "".join(lines)[:size]
+
+
+CORPORA: dict[str, Callable[[int, random.Random], str]] = {
+    "random": generate_random,
+    "english": generate_english,
+    "repetitive": generate_repetitive,
+    "log": generate_log,
+}
+
+
+def generate_corpus(kind: str, size: int, seed: int) -> str:
+    """
+    Generate size characters of the given kind of corpus. The same (kind, size, seed) always gives the same text.
+    """
+    if kind not in CORPORA:
+        raise ValueError(f"unknown corpus {kind!r}, expected one of {list(CORPORA)}")
+
+    return CORPORA[kind](size, random.Random(f"{kind}-{size}-{seed}"))
@@ -0,0 +1,247 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "Benchmark of every pipeline stage, with JSON output and comparison against a saved baseline"
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpora import CORPORA, generate_corpus
+from bitstream import BitReader, BitWriter
+from bwt import bwt_decode, bwt_encode_naive, bwt_encode_with_sais, bwt_encode_with_ukkonen
+from bwtunzip import decoder, split_table_and_body
+from bwtzip import encoder
+from mtf import mtf_decoder, mtf_encoder
+from runlength_decoder import runlength_decoder
+from runlength_encoder import runlength_encoder
+from sais import suffix_array as suffix_array_with_sais
+from st2sa import suffix_array
+
+MB = 1_000_000
+
+
+class PreparedCorpus:
+    """
+    A corpus with the output of each stage precomputed, so that every stage can be timed on its own input.
+    """
+    def __init__(self, kind: str, text: str) -> None:
+        self.kind: str = kind
+        self.text: str = text
+        self.bwt_text: str = bwt_encode_with_sais(text)
+
+        bits = BitWriter()
+        runlength_encoder(self.bwt_text, bits)
+        self.runlength_payload: bytes = bits.getvalue()
+
+        bits = BitWriter()
+        mtf_encoder(self.bwt_text, bits)
+        self.mtf_payload: bytes = bits.getvalue()
+
+        self.container: bytes = encoder(text)
+
+
+def run_suffix_array(corpus: PreparedCorpus) -> None:
+    suffix_array(corpus.text)
+
+
+def run_suffix_array_with_sais(corpus: PreparedCorpus) -> None:
+    suffix_array_with_sais(corpus.text)
+
+
+def run_bwt_encode_with_ukkonen(corpus: PreparedCorpus) -> None:
+    bwt_encode_with_ukkonen(corpus.text)
+
+
+def run_bwt_encode_with_sais(corpus: PreparedCorpus) -> None:
+    bwt_encode_with_sais(corpus.text)
+
+
+def run_bwt_encode_naive(corpus: PreparedCorpus) -> None:
+    bwt_encode_naive(corpus.text)
+
+
+def run_runlength_encoder(corpus: PreparedCorpus) -> int:
+    bits = BitWriter()
+    runlength_encoder(corpus.bwt_text, bits)
+    return len(bits.getvalue())
+
+
+def run_runlength_decoder(corpus: PreparedCorpus) -> None:
+    body, code_lengths = split_table_and_body(BitReader(corpus.runlength_payload))
+    runlength_decoder(body, code_lengths, len(corpus.bwt_text))
+
+
+def run_mtf_encoder(corpus: PreparedCorpus) -> int:
+    bits = BitWriter()
+    mtf_encoder(corpus.bwt_text, bits)
+    return len(bits.getvalue())
+
+
+def run_mtf_decoder(corpus: PreparedCorpus) -> None:
+    mtf_decoder(BitReader(corpus.mtf_payload), len(corpus.bwt_text))
+
+
+def run_bwt_decode(corpus: PreparedCorpus) -> None:
+    bwt_decode(corpus.bwt_text)
+
+
+def run_encoder(corpus: PreparedCorpus) -> int:
+    return len(encoder(corpus.text))
+
+
+def run_decoder(corpus: PreparedCorpus) -> None:
+    decoder(corpus.container)
+
+
+# each stage runs on its own input and returns the size of its output in bytes if it compresses (None otherwise)
+STAGES: dict[str, Callable[[PreparedCorpus], Optional[int]]] = {
+    "st2sa.suffix_array": run_suffix_array,
+    "sais.suffix_array": run_suffix_array_with_sais,
+    "bwt_encode_with_ukkonen": run_bwt_encode_with_ukkonen,
+    "bwt_encode_with_sais": run_bwt_encode_with_sais,
+    "bwt_encode_naive": run_bwt_encode_naive,
+    "runlength_encoder": run_runlength_encoder,
+    "runlength_decoder": run_runlength_decoder,
+    "mtf_encoder": run_mtf_encoder,
+    "mtf_decoder": run_mtf_decoder,
+    "bwt_decode": run_bwt_decode,
+    "bwtzip.encoder": run_encoder,
+    "bwtunzip.decoder": run_decoder,
+}
+
+NAIVE_STAGES = ("bwt_encode_naive",)  # quadratic memory, only run up to --naive-limit characters
+
+
+def measure_stage(stage: str, corpus: PreparedCorpus, repeats: int) -> dict:
+    """
+    Time a stage (the best of repeats runs), then run it once more under tracemalloc for its peak memory, which is kept
+    out of the timed runs since tracing slows every allocation down.
+    """
+    run = STAGES[stage]
+
+    best_seconds = float("inf")
+    output_size = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output_size = run(corpus)
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run(corpus)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    size = len(corpus.text)
+    return {
+        "stage": stage,
+        "corpus": corpus.kind,
+        "size": size,
+        "seconds": best_seconds,
+        "mb_per_s": size / MB / best_seconds if best_seconds > 0 else None,
+        "peak_memory_bytes": peak_memory,
+        "compression_ratio": output_size / size if output_size is not None and size else None,
+    }
+
+
+def result_key(result: dict) -> tuple[str, str, int]:
+    return result["stage"], result["corpus"], result["size"]
+
+
+def compare_with_baseline(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """
+    Compare the results with a saved baseline run.
+    A stage regresses if it got more than tolerance slower (e.g. 0.2 = 20%), if it compresses worse, or if its peak
+    memory grew by more than tolerance.
+
+    :return: a description of each regression
+    """
+    baseline_results = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline_results.get(result_key(result))
+        if old is None:
+            continue
+
+        name = "{} on {} ({} chars)".format(*result_key(result))
+        if result["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {old['seconds']:.4f}s -> {result['seconds']:.4f}s")
+        if result["peak_memory_bytes"] > old["peak_memory_bytes"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {old['peak_memory_bytes']} -> {result['peak_memory_bytes']} bytes")
+        if old["compression_ratio"] is not None and result["compression_ratio"] is not None \
+                and result["compression_ratio"] > old["compression_ratio"]:
+            regressions.append(f"{name}: compression ratio {old['compression_ratio']:.4f} -> "
+                               f"{result['compression_ratio']:.4f}")
+
+    return regressions
+
+
+def run_benchmarks(stages: list[str], corpora: list[str], sizes: list[int], repeats: int, seed: int,
+                   naive_limit: int) -> list[dict]:
+    results = []
+    for kind in corpora:
+        for size in sizes:
+            corpus = PreparedCorpus(kind, generate_corpus(kind, size, seed))
+            for stage in stages:
+                if stage in NAIVE_STAGES and size > naive_limit:
+                    continue
+
+                result = measure_stage(stage, corpus, repeats)
+                results.append(result)
+                print(f"{stage:>24} {kind:>10} {size:>8} {result['seconds']:>9.4f}s "
+                      f"{result['mb_per_s'] or 0:>8.3f} MB/s {result['peak_memory_bytes'] / MB:>8.2f} MB",
+                      file=sys.stderr)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every stage of the pipeline on reproducible corpora")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--corpora", nargs="+", choices=list(CORPORA), default=list(CORPORA))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000],
+                        help="number of characters of each corpus (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="number of timed runs per stage, the best one is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--naive-limit", type=int, default=2_000,
+                        help="largest corpus bwt_encode_naive is run on (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown or memory growth reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.stages, args.corpora, args.sizes, args.repeats, args.seed, args.naive_limit)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeats": args.repeats,
+        "results": results,
+    }
+
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            regressions = compare_with_baseline(results, json.load(file)["results"], args.tolerance)
+
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regression against the baseline", file=sys.stderr)
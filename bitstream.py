@@ -0,0 +1,133 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "The implementation of buffer-backed bit streams"
+
+from typing import Optional
+
+
+class BitReader:
+    """
+    Reads bits (most significant bit first) from a bytes-like buffer, keeping a cursor instead of slicing.
+
+    Unlike BitArray, reading k bits only touches the bytes those bits live in, so consuming a whole buffer is linear in
+    its size rather than quadratic.
+    """
+
+    def __init__(self, data: bytes, n_bits: Optional[int] = None) -> None:
+        self.data: memoryview = memoryview(data)
+        self.n_bits: int = len(self.data) * 8 if n_bits is None else n_bits
+        self.position: int = 0  # the index of the next bit to read
+
+        assert self.n_bits <= len(self.data) * 8, "n_bits exceeds the size of the buffer"
+
+    def __len__(self) -> int:
+        """
+        The number of bits that are left to read.
+        """
+        return self.n_bits - self.position
+
+    def peek_bits(self, k: int) -> int:
+        """
+        Return the next k bits as an integer without moving the cursor.
+        Bits past the end of the stream are read as 0s, so table decoders can always peek a fixed number of bits.
+
+        :time complexity: O(k)
+        """
+        if k == 0:
+            return 0
+
+        byte_idx, bit_offset = self.position >> 3, self.position & 7
+        n_bytes = (bit_offset + k + 7) >> 3
+        chunk_bytes = self.data[byte_idx:byte_idx + n_bytes]
+        chunk = int.from_bytes(chunk_bytes, byteorder="big") << ((n_bytes - len(chunk_bytes)) << 3)
+
+        bits = (chunk >> ((n_bytes << 3) - bit_offset - k)) & ((1 << k) - 1)
+
+        # mask out anything beyond n_bits (e.g. padding)
+        overflow = self.position + k - self.n_bits
+        if overflow > 0:
+            bits = (bits >> overflow) << overflow
+
+        return bits
+
+    def read_bits(self, k: int) -> int:
+        """
+        Return the next k bits as an integer and move the cursor past them.
+
+        :time complexity: O(k)
+        """
+        if self.position + k > self.n_bits:
+            raise EOFError("not enough bits left in the stream")
+
+        bits = self.peek_bits(k)
+        self.position += k
+        return bits
+
+    def read_bit(self) -> int:
+        if self.position >= self.n_bits:
+            raise EOFError("not enough bits left in the stream")
+
+        bit = (self.data[self.position >> 3] >> (7 - (self.position & 7))) & 1
+        self.position += 1
+        return bit
+
+    def skip_bits(self, k: int) -> None:
+        if self.position + k > self.n_bits:
+            raise EOFError("not enough bits left in the stream")
+
+        self.position += k
+
+
+class BitWriter:
+    """
+    Writes bits (most significant bit first) into a bytearray.
+
+    Bits are packed into an accumulator that is flushed as whole bytes once it holds 64 bits, so appending is
+    amortised O(k) for k bits instead of shifting an ever-growing integer like BitArray.extend does.
+    """
+
+    ACCUMULATOR_N_BITS = 64
+
+    def __init__(self) -> None:
+        self.buffer: bytearray = bytearray()
+        self.accumulator: int = 0
+        self.n_accumulated: int = 0  # the number of bits in the accumulator
+
+    def __len__(self) -> int:
+        """
+        The number of bits written so far.
+        """
+        return len(self.buffer) * 8 + self.n_accumulated
+
+    def write_bits(self, bits: int, k: int) -> None:
+        """
+        Append the k lowest bits of bits.
+        """
+        assert 0 <= bits < (1 << k), "bits does not fit in k bits"
+
+        self.accumulator = (self.accumulator << k) | bits
+        self.n_accumulated += k
+
+        if self.n_accumulated >= self.ACCUMULATOR_N_BITS:
+            self._flush_whole_bytes()
+
+    def write_bit(self, bit: int) -> None:
+        assert bit == 0 or bit == 1, "bit must be 0 or 1"
+        self.write_bits(bit, 1)
+
+    def _flush_whole_bytes(self) -> None:
+        """
+        Move every whole byte in the accumulator to the buffer; keep the remaining (< 8) bits.
+        """
+        n_bytes, n_remaining = self.n_accumulated >> 3, self.n_accumulated & 7
+        self.buffer += (self.accumulator >> n_remaining).to_bytes(n_bytes, byteorder="big")
+        self.accumulator &= (1 << n_remaining) - 1
+        self.n_accumulated = n_remaining
+
+    def getvalue(self) -> bytes:
+        """
+        Return everything written so far, padded by 0s up to a byte boundary.
+        """
+        n_padding = -self.n_accumulated % 8
+        tail = (self.accumulator << n_padding).to_bytes((self.n_accumulated + n_padding) >> 3, byteorder="big")
+        return bytes(self.buffer) + tail
@@ -2,22 +2,66 @@ __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 __description__ = "The implementation of BWT encoder and decoder"
 
-from typing import Optional
-from utilities import hash_char
-from st2sa import suffix_array as get_suffix_array
+from array import array
+from typing import Callable, Iterable, Optional
+from utilities import MIN_ASCII, MAX_ASCII, SENTINEL, hash_char
+from st2sa import iter_suffix_array as get_suffix_array, iter_suffix_array_compact as get_suffix_array_with_compact_tree
+from sais import suffix_array as get_suffix_array_with_sais
+from profiling import profile_stage
+
+# the suffix array builders that can be used for BWT; all of them produce the same 1-based suffix array
+# (the suffix tree backends stream it straight out of the tree traversal)
+SUFFIX_ARRAY_BACKENDS: dict[str, Callable[[str], Iterable[int]]] = {
+    "ukkonen": get_suffix_array,
+    "compact-ukkonen": get_suffix_array_with_compact_tree,
+    "sais": get_suffix_array_with_sais,
+}
+DEFAULT_SUFFIX_ARRAY_BACKEND = "sais"
+
+
+def bwt_encode(text: str, backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND) -> str:
+    """
+    BWT encoder using the selected suffix array backend.
+    "ukkonen" builds a suffix tree and traverses it, "compact-ukkonen" does the same with an array-backed suffix tree
+    (ukkonen.CompactSuffixTree); "sais" sorts the suffixes of an integer array directly and
+    only uses a few bytes per character.
+
+    :param text: text to encode
+    :param backend: one of SUFFIX_ARRAY_BACKENDS
+    :return: the encoded text (including "$")
+    """
+    if backend not in SUFFIX_ARRAY_BACKENDS:
+        raise ValueError(f"unknown suffix array backend {backend!r}, expected one of {list(SUFFIX_ARRAY_BACKENDS)}")
+
+    return bwt_encode_from_suffix_array(text, SUFFIX_ARRAY_BACKENDS[backend](text))
 
-MIN_ASCII, MAX_ASCII = 37, 126
 
 def bwt_encode_with_ukkonen(text: str) -> str:
-    suffix_array = get_suffix_array(text)
+    return bwt_encode_from_suffix_array(text, get_suffix_array(text))
+
+
+def bwt_encode_with_sais(text: str) -> str:
+    return bwt_encode_from_suffix_array(text, get_suffix_array_with_sais(text))
+
+
+def bwt_encode_from_suffix_array(text: str, suffix_array: Iterable[int]) -> str:
+    """
+    Take the character preceding each suffix (in the 1-based suffix array of text + "$") as the last column.
+    The suffix array is only iterated once, so it can be a generator. When it is (the suffix tree backends), the
+    "bwt_gather" stage also includes the in-order traversal of the tree that streams the suffix array.
+    """
+    with profile_stage("bwt_gather", bytes_in=len(text)) as stage:
+        n = len(text)+1  # the length of the suffix array
+        last_items = [None]*n
 
-    last_items = [None]*len(suffix_array)
+        for i, index in enumerate(suffix_array):
+            last_item_index = (index-1 + n-1) % n
+            last_items[i] = text[last_item_index] if last_item_index != n-1 else SENTINEL
 
-    for i, index in enumerate(suffix_array):
-        last_item_index = (index-1 + len(suffix_array)-1) % len(suffix_array)
-        last_items[i] = text[last_item_index] if last_item_index != len(suffix_array)-1 else "$"
+        bwt_text = "".join(last_items)
+        stage.bytes_out = len(bwt_text)
 
-    return "".join(last_items)
+    return bwt_text
 
 
 def bwt_encode_naive(text: str) -> str:
@@ -26,14 +70,14 @@ def bwt_encode_naive(text: str) -> str:
     """
 
     # create circular suffixes
-    text = text + "$"
+    text = text + SENTINEL
     circular_suffixes = [None] * len(text)
     for start_idx in range(len(text)):
         circular_suffixes[start_idx] = text[start_idx:len(text)] + text[0:start_idx]
 
 
     # sort based on the first character, second character, ....
-    sorted_circular_suffixes = sorted(circular_suffixes)
+    sorted_circular_suffixes = sorted(circular_suffixes, key=lambda suffix: [hash_char(char) for char in suffix])
 
     return "".join([x[-1] for x in sorted_circular_suffixes])
 
@@ -61,13 +105,14 @@ def get_order(char, i, order_table) -> int:
     raise ValueError("shouldn't come here")
 
 
-def bwt_decode(text: str) -> str:
+def bwt_decode_naive(text: str) -> str:
     """
-    Implementation of BWT decoder. Use LF-mapping.
+    Implementation of BWT decoder. Use LF-mapping, finding the order of each character with get_order.
 
     Note: order table = nOccurences table in lecture note
 
-    :time complexity: O(n) where n is the length of string
+    :time complexity: O(n*X) where n is the length of string and X is the number of appearances of the most common
+    character (i.e. quadratic on low entropy text where a few characters dominate)
     :aux space complexity: O(n) for the encoded string, rank and order table
     :param text: encoded text (text to decode)
     :return: the original string
@@ -105,4 +150,59 @@ def bwt_decode(text: str) -> str:
     decoded_text.pop()  # pop "$"
     decoded_text.reverse()
 
-    return "".join(decoded_text)
\ No newline at end of file
+    return "".join(decoded_text)
+
+def compute_lf_mapping(text: str) -> array:
+    """
+    Precompute the LF-mapping of every position of the encoded text, i.e. lf[i] = rank(L[i]) + order of L[i] among the
+    same characters in L[:i]. Each LF step during decoding then becomes a single array lookup.
+
+    :time complexity: O(n) where n is the length of string
+    :aux space complexity: O(n) for the lf array (4 bytes per character)
+    :param text: encoded text
+    :return: the lf array
+    """
+    # count each character and make the counts cumulative -> rank table
+    rank_table = [0]*(MAX_ASCII-MIN_ASCII+2)
+    for char in text:
+        rank_table[hash_char(char)] += 1
+
+    acum = 0
+    for i in range(len(rank_table)):
+        acum_temp = acum
+        acum += rank_table[i]
+        rank_table[i] = acum_temp
+
+    # the rank table now holds the next free row of each character, so take it and increment it
+    lf = array("i", [0])*len(text)
+    for i, char in enumerate(text):
+        ascii_index = hash_char(char)
+        lf[i] = rank_table[ascii_index]
+        rank_table[ascii_index] += 1
+
+    return lf
+
+
+def bwt_decode(text: str) -> str:
+    """
+    Implementation of BWT decoder, using a precomputed LF-mapping array so that each LF step takes constant time.
+
+    :time complexity: O(n) where n is the length of string
+    :aux space complexity: O(n) for the lf array and the decoded string
+    :param text: encoded text (text to decode)
+    :return: the original string
+    """
+    with profile_stage("bwt_decode", bytes_in=len(text)) as stage:
+        lf = compute_lf_mapping(text)
+
+        decoded_text = [None]*len(text)
+        l_idx = 0
+        for i in range(len(text)-1, -1, -1):
+            decoded_text[i] = text[l_idx]
+            l_idx = lf[l_idx]
+
+        # decoded backwards, so "$" ended up first
+        original_text = "".join(decoded_text[1:])
+        stage.bytes_out = len(original_text)
+
+    return original_text
@@ -1,68 +1,311 @@
 __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 
-from typing import Optional
-import sys
+from contextlib import nullcontext
+from typing import BinaryIO, Iterator, Optional
+import argparse
 
 from bwt import bwt_decode
 from runlength_decoder import runlength_decoder
+from mtf import mtf_decoder
 from elias import elias_decode
-from utilities import MAX_ASCII, MIN_ASCII, hash_char_from_ascii
-from original_bitarray import BitArray
+from huffman import read_code_lengths
+from utilities import MAX_ASCII, MIN_ASCII, STDIO_PATH, TEXT_ENCODING, is_mappable, map_file, open_input, open_output
+from bitstream import BitReader
+from container import CODER_N_BITS, CODERS, FRAME_N_BYTES, HEADER_N_BYTES, INDEX_ENTRY_N_BYTES, TRAILER_N_BYTES, \
+    BlockIndexEntry, iter_payloads_from_file, read_footer, read_header, read_index, read_index_from_file, \
+    read_payload_from_file
+from parallel import ordered_parallel_map, resolve_jobs
+from profiling import Profiler, profile_stage
 
 
-def bytes_to_bitarray(byte_data) -> BitArray:
-    num = int.from_bytes(byte_data, byteorder='big')  # convert bytes into integer
-    n_bits = len(byte_data) * 8  # calculate the length
+def split_table_and_body(data_bits: BitReader) -> tuple[BitReader, list[int]]:
+    """
+    Read the code lengths of the canonical huffman codes; the reader is left at the start of the body.
+    """
+    code_lengths = read_code_lengths(data_bits, MAX_ASCII - MIN_ASCII + 2)
 
-    # edge case (if no text is encoded)
-    if num == 0:
-        return BitArray()
+    body = data_bits
 
-    # create a BitArray instance with the integer and number of bits
-    return BitArray(num, n_bits=n_bits)
+    return body, code_lengths
 
-def split_table_and_body(data_bits: BitArray, n_unique_chars: int) -> tuple[BitArray, list]:
-    code_table: list[Optional[BitArray]] = [None] * (MAX_ASCII - MIN_ASCII + 2)
 
-    for _ in range(n_unique_chars):
-        char_idx = hash_char_from_ascii(data_bits[:7].to_decimal())
-        codeword_length, remainder = elias_decode(data_bits[7:])
-        code_table[char_idx] = remainder[:codeword_length]  # note: this is constant operation (see implementation)
+def decode_block_bwt(encoded_text: BitReader) -> str:
+    """
+    Undo the coding stage of a block, giving its BWT text (with "$") without inverting it.
 
-        data_bits = remainder[codeword_length:]
+    block encoding format:
+    bwt_length (elias),
+    coder (2 bits, see container.CODERS),
+    encoded bwt text (see runlength_encoder or mtf_encoder)
+    """
+    # separate the header and the body part
+    bwt_length = elias_decode(encoded_text)  # decoding bwt_length
+    coder = encoded_text.read_bits(CODER_N_BITS)
 
-    body = data_bits
+    if coder == CODERS["mtf"]:
+        decoded_text = mtf_decoder(encoded_text, bwt_length)  # move-to-front decoding
+    elif coder == CODERS["runlength"]:
+        body, code_lengths = split_table_and_body(encoded_text)  # split the header and the body
+        decoded_text = runlength_decoder(body, code_lengths, bwt_length)  # runlength decoding
+    else:
+        raise ValueError(f"unknown coder {coder}")
 
-    return body, code_table
+    return decoded_text
 
 
-def decoder(encoded_text: BitArray) -> str:
+def decode_block(encoded_text: BitReader) -> str:
     """
-    encoding format:
-    bwt_length (elias),
-    n_unique_key (elias),
-    table (ascii, elias run length, huffman codeword),
-    main_text (elias length, huffman codeword)
+    Decode one block: undo the coding stage (see decode_block_bwt), then BWT.
     """
-    # separate the header and the body part
-    bwt_length, remainder = elias_decode(encoded_text)  # decoding bwt_length
-    n_unique_chars, remainder = elias_decode(remainder)  # decoding  n_unique_chars
-
-    body, code_table = split_table_and_body(remainder, n_unique_chars)  # split the header and the body
-    decoded_text = runlength_decoder(body, code_table, bwt_length)  # runlength decoding
-    original_text = bwt_decode(decoded_text)  # bwt decoding
+    with profile_stage("decode_block", bytes_in=len(encoded_text) // 8) as stage:
+        decoded_text = decode_block_bwt(encoded_text)
+        original_text = bwt_decode(decoded_text)  # bwt decoding
+        stage.bytes_out = len(original_text)
 
     return original_text
 
 
+def decode_payload(payload: bytes) -> str:
+    """
+    Decode one encoded block. Module level so that it can be sent to worker processes.
+    """
+    return decode_block(BitReader(payload))
+
+
+def decode_payload_bwt(payload: bytes) -> str:
+    """
+    Decode one encoded block into its BWT text. Module level so that it can be sent to worker processes.
+    """
+    return decode_block_bwt(BitReader(payload))
+
+
+def iter_decoded_blocks(data: bytes, jobs: Optional[int] = 1) -> Iterator[str]:
+    """
+    Decode the blocks of a container one by one, in order.
+    The block index in the footer tells where each block is, so blocks can be decoded in a pool of worker processes.
+    data can be a memoryview (e.g. of a memory-mapped file), in which case each block is decoded from a view of the
+    buffer without copying it.
+
+    :param data: the whole container
+    :param jobs: the number of worker processes decoding blocks in parallel (None or 0 for every core)
+    :return: an iterator over the decoded blocks
+    """
+    read_header(data)
+    index = read_index(data)
+
+    payloads = (entry.get_payload(data) for entry in index)
+    if resolve_jobs(jobs) > 1:
+        # views cannot be sent to worker processes, so only then each payload is copied
+        payloads = (bytes(payload) for payload in payloads)
+
+    for entry, decoded_block in zip(index, ordered_parallel_map(decode_payload, payloads, jobs)):
+        if len(decoded_block) != entry.original_size:
+            raise ValueError("decoded block size does not match the block index")
+        yield decoded_block
+
+
+def decoder(data: bytes, jobs: Optional[int] = 1) -> str:
+    """
+    Decode a container created by bwtzip.encoder.
+
+    :param data: the whole container
+    :param jobs: the number of worker processes decoding blocks in parallel (None or 0 for every core)
+    :return: the original text
+    """
+    return "".join(iter_decoded_blocks(data, jobs))
+
+
+def decode_stream(input_file: BinaryIO, output_file: BinaryIO, jobs: Optional[int] = 1, use_mmap: bool = True) -> None:
+    """
+    Decode a container from input_file and write the text to output_file block by block, so that memory is bounded by
+    a few blocks however large the text is. output_file is never seeked, so it can be a pipe.
+    A regular input file is memory-mapped and its blocks are found with the block index, so only the pages of the
+    blocks being decoded are touched. Any other input (e.g. a pipe) is read sequentially, and the footer is only read
+    at the end to check the decoded blocks against the block index.
+
+    :param input_file: the container, opened in binary mode
+    :param output_file: where the text is written, opened in binary mode (every character is one byte)
+    :param jobs: the number of worker processes decoding blocks in parallel (None or 0 for every core)
+    :param use_mmap: whether to memory-map input_file when it is a regular file
+    """
+    if use_mmap and is_mappable(input_file):
+        with map_file(input_file) as data:
+            for decoded_block in iter_decoded_blocks(data, jobs):
+                output_file.write(decoded_block.encode(TEXT_ENCODING))
+        return
+
+    read_header(input_file.read(HEADER_N_BYTES))
+
+    decoded_sizes = []
+    for decoded_block in ordered_parallel_map(decode_payload, iter_payloads_from_file(input_file), jobs):
+        output_file.write(decoded_block.encode(TEXT_ENCODING))
+        decoded_sizes.append(len(decoded_block))
+
+    index = read_footer(input_file.read())
+    if [entry.original_size for entry in index] != decoded_sizes:
+        raise ValueError("decoded block sizes do not match the block index")
+
+
+class Decompressor:
+    """
+    Push-style decoder, like bz2.BZ2Decompressor: feed the container to decompress as it arrives.
+
+        decompressor = Decompressor()
+        for chunk in chunks:
+            output_file.write(decompressor.decompress(chunk))
+
+    Each block is decoded as soon as its last byte arrives, so memory is bounded by a block (and the size of a chunk)
+    however large the container is. Once the footer has been read eof is set; any bytes after it are kept in
+    unused_data, like in bz2.
+    """
+    def __init__(self) -> None:
+        self.buffer: bytearray = bytearray()  # the bytes received but not consumed yet
+        self.header_read: bool = False
+        self.end_of_stream: bool = False  # whether the end of stream marker has been read (only the footer is left)
+        self.decoded_sizes: list[int] = []
+        self.eof: bool = False
+        self.unused_data: bytes = b""
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        :param data: the next piece of the container
+        :return: the text of every block completed by data (every character is one byte), possibly empty
+        """
+        if self.eof:
+            raise EOFError("end of stream already reached")
+
+        self.buffer += data
+        if not self.header_read:
+            if len(self.buffer) < HEADER_N_BYTES:
+                return b""
+            read_header(bytes(self.buffer[:HEADER_N_BYTES]))
+            del self.buffer[:HEADER_N_BYTES]
+            self.header_read = True
+
+        # decode every complete framed block in the buffer
+        decoded_blocks = []
+        start = 0
+        while not self.end_of_stream and len(self.buffer) - start >= FRAME_N_BYTES:
+            payload_size = int.from_bytes(self.buffer[start:start + FRAME_N_BYTES], byteorder="big")
+            if payload_size == 0:
+                self.end_of_stream = True
+                start += FRAME_N_BYTES
+                break
+
+            payload_start = start + FRAME_N_BYTES
+            if len(self.buffer) - payload_start < payload_size:
+                break
+
+            decoded_block = decode_payload(bytes(self.buffer[payload_start:payload_start + payload_size]))
+            decoded_blocks.append(decoded_block.encode(TEXT_ENCODING))
+            self.decoded_sizes.append(len(decoded_block))
+            start = payload_start + payload_size
+
+        del self.buffer[:start]
+
+        # the footer has one index entry per block, so its size is known once the end of stream marker is read
+        footer_size = len(self.decoded_sizes) * INDEX_ENTRY_N_BYTES + TRAILER_N_BYTES
+        if self.end_of_stream and len(self.buffer) >= footer_size:
+            index = read_footer(bytes(self.buffer[:footer_size]))
+            if [entry.original_size for entry in index] != self.decoded_sizes:
+                raise ValueError("decoded block sizes do not match the block index")
+
+            self.unused_data = bytes(self.buffer[footer_size:])
+            self.buffer = bytearray()
+            self.eof = True
+
+        return b"".join(decoded_blocks)
+
+
+def find_blocks_in_range(index: list[BlockIndexEntry], start: int, end: int) -> list[tuple[int, BlockIndexEntry]]:
+    """
+    Find the blocks that cover the characters text[start:end] using the original sizes in the block index.
+
+    :time complexity: O(b) where b is the number of blocks
+    :return: for each covering block, the position of its first character in the text and its index entry
+    """
+    covering_blocks = []
+    block_start = 0
+    for entry in index:
+        block_end = block_start + entry.original_size
+        if block_start >= end:
+            break
+        if block_end > start:
+            covering_blocks.append((block_start, entry))
+        block_start = block_end
+
+    return covering_blocks
+
+
+def decompress_range(path: str, start: int, end: int, jobs: Optional[int] = 1) -> str:
+    """
+    Decode text[start:end] of the text stored in a container file.
+    Only the blocks covering the range are read from the file and decoded.
+
+    :param path: the path of the container
+    :param start: the position of the first character (inclusive)
+    :param end: the position of the last character (exclusive); clipped to the length of the text
+    :param jobs: the number of worker processes decoding blocks in parallel (None or 0 for every core)
+    :return: the characters in the range
+    """
+    if not 0 <= start <= end:
+        raise ValueError("the range must satisfy 0 <= start <= end")
+
+    with open(path, "rb") as file:
+        index = read_index_from_file(file)
+        covering_blocks = find_blocks_in_range(index, start, end)
+        payloads = [read_payload_from_file(file, entry) for _, entry in covering_blocks]
+
+    if not covering_blocks:
+        return ""
+
+    decoded_text = "".join(ordered_parallel_map(decode_payload, payloads, jobs))
+
+    # the decoded blocks start at the first covering block, not at the beginning of the text
+    first_block_start = covering_blocks[0][0]
+    return decoded_text[start - first_block_start:end - first_block_start]
+
+
 if __name__ == "__main__":
-    _, encoded_text_filename = sys.argv
+    parser = argparse.ArgumentParser(description="Unzip a file (or stdin) created by bwtzip")
+    parser.add_argument("filename", nargs="?", default=STDIO_PATH,
+                        help="container to unzip, or - to read stdin (default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="where to write the text, or - for stdout "
+                             "(default: recovered.txt, or stdout when reading stdin)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes decoding blocks in parallel, 0 for every core "
+                             "(default: %(default)s)")
+    parser.add_argument("--range", type=int, nargs=2, metavar=("START", "END"),
+                        help="only decode the characters from START (inclusive) to END (exclusive); needs a file, "
+                             "not stdin")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write the time, calls and bytes in/out of each stage as JSON to PATH "
+                             "(stages in worker processes are not recorded, use --jobs 1)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also record the peak memory of each stage with tracemalloc (slow)")
+    parser.add_argument("--no-mmap", action="store_true",
+                        help="read the input file sequentially instead of memory-mapping it")
+    args = parser.parse_args()
+
+    output_filename = args.output
+    if output_filename is None:
+        output_filename = STDIO_PATH if args.filename == STDIO_PATH else "recovered.txt"
 
-    with open(encoded_text_filename, "rb") as file:
-        ba = bytes_to_bitarray(file.read())
+    profiler = Profiler(trace_memory=args.profile_memory)
+    with profiler if args.profile is not None else nullcontext():
+        if args.range is not None:
+            if args.filename == STDIO_PATH:
+                parser.error("--range needs a file to seek in, not stdin")
 
-    output_filename = "recovered.txt"
-    with open(output_filename, "w") as file:
-        file.write(decoder(ba))
+            recovered_text = decompress_range(args.filename, *args.range, jobs=args.jobs)
+            with open_output(output_filename) as output_file:
+                output_file.write(recovered_text.encode(TEXT_ENCODING))
+        else:
+            with open_input(args.filename) as input_file, open_output(output_filename) as output_file:
+                decode_stream(input_file, output_file, args.jobs, use_mmap=not args.no_mmap)
 
+    if args.profile is not None:
+        with open(args.profile, "w") as file:
+            file.write(profiler.to_json())
@@ -1,53 +1,308 @@
 __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 
-import sys
+import argparse
+import os
+from contextlib import nullcontext
+from functools import partial
+from typing import BinaryIO, Iterable, Iterator, Optional
 
 from elias import elias_encode
-from bwt import bwt_encode_naive, bwt_encode_with_ukkonen
+from bwt import DEFAULT_SUFFIX_ARRAY_BACKEND, SUFFIX_ARRAY_BACKENDS, bwt_encode, bwt_encode_naive
 from runlength_encoder import runlength_encoder
-from original_bitarray import BitArray
+from mtf import mtf_encoder
+from bitstream import BitWriter
+from container import CODER_N_BITS, CODERS, DEFAULT_CODER, DEFAULT_BLOCK_SIZE, END_OF_STREAM, FRAME_N_BYTES, BlockIndexEntry, create_footer, create_header, \
+    frame_block, read_append_point, read_text_blocks, split_buffer_into_blocks, split_into_blocks
+from parallel import ordered_parallel_map
+from profiling import Profiler, profile_stage
+from utilities import STDIO_PATH, TEXT_ENCODING, is_mappable, map_file, open_input, open_output
 
-def pad_by_zeroes(encoded_text: BitArray) -> BitArray:
-    # pad by 0s if there is remainder
-    num_zeroes = 8 - len(encoded_text) % 8
-    for _ in range(num_zeroes):
-        encoded_text.append(0)
+def encode_block(text: str, backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND, coder: str = DEFAULT_CODER) -> bytes:
+    """
+    block encoding format:
+    bwt_length (elias),
+    coder (2 bits, see container.CODERS),
+    encoded bwt text (see runlength_encoder or mtf_encoder),
+    padded by 0s to a byte boundary
+    """
+    if coder not in CODERS:
+        raise ValueError(f"unknown coder {coder!r}, expected one of {list(CODERS)}")
+
+    with profile_stage("encode_block", bytes_in=len(text)) as stage:
+        bits = BitWriter()
+        elias_encode(len(text)+1, bits)  # +1 for dollar symbol
+        bits.write_bits(CODERS[coder], CODER_N_BITS)
 
-    return encoded_text
+        bwt_text = bwt_encode(text, backend)  # change to bwt_encode_naive(text) see the difference
+        if coder == "mtf":
+            mtf_encoder(bwt_text, bits)
+        else:
+            runlength_encoder(bwt_text, bits)
 
+        payload = bits.getvalue()
+        stage.bytes_out = len(payload)
 
-def encoder(text: str) -> BitArray:
+    return payload
+
+
+def encode_framed_block(text: str, backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND,
+                        coder: str = DEFAULT_CODER) -> tuple[int, bytes]:
     """
-    encoding format:
-    bwt_length (elias),
-    n_unique_key (elias),
-    table (ascii, elias run length, huffman codeword),
-    main_text (elias length, huffman codeword)
+    Encode one block and frame it. Module level so that it can be sent to worker processes.
+
+    :return: the number of characters in the block, and the framed block
+    """
+    return len(text), frame_block(encode_block(text, backend, coder))
+
+
+def iter_encoded_parts(blocks: Iterable[str], block_size: int = DEFAULT_BLOCK_SIZE, jobs: Optional[int] = 1,
+                       backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND, coder: str = DEFAULT_CODER) -> Iterator[bytes]:
+    """
+    Yield the container piece by piece (header, each framed block, end of stream marker, footer) so that a caller can
+    write each block out as soon as it is encoded.
+    Blocks are independent, so with jobs > 1 they are encoded in a pool of worker processes and written back in order.
+    blocks is consumed lazily, so it can be a generator reading the input block by block.
+
+    :param blocks: the text cut into blocks of (at most) block_size characters
+    """
+    header = create_header(block_size)
+    yield header
+    yield from iter_encoded_tail(blocks, [], len(header), jobs, backend, coder)
+
+
+def iter_encoded_tail(blocks: Iterable[str], index: list[BlockIndexEntry], offset: int, jobs: Optional[int] = 1,
+                      backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND, coder: str = DEFAULT_CODER) -> Iterator[bytes]:
+    """
+    Yield the end of a container from the given offset on: each framed block, the end of stream marker, and the
+    footer indexing the blocks already in index followed by the new ones.
+
+    :param index: the index entries of the blocks before offset; the new entries are appended to it
+    :param offset: the byte offset at which the first new block goes
+    """
+    # keep track of where each block goes for the index in the footer
+    encode = partial(encode_framed_block, backend=backend, coder=coder)
+    for original_size, framed_block in ordered_parallel_map(encode, blocks, jobs):
+        index.append(BlockIndexEntry(offset + FRAME_N_BYTES, len(framed_block) - FRAME_N_BYTES, original_size))
+        yield framed_block
+        offset += len(framed_block)
+
+    yield END_OF_STREAM
+    yield create_footer(index, offset + len(END_OF_STREAM))
+
+
+def encoder(text: str, block_size: int = DEFAULT_BLOCK_SIZE, jobs: Optional[int] = 1,
+            backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND, coder: str = DEFAULT_CODER) -> bytes:
+    """
+    Encode the text into a container: the text is cut into blocks of block_size characters and each block is encoded
+    independently, so that the memory used by BWT is bounded by the block size, not by the length of the text.
+
+    container format:
+    header (magic, version, block size),
+    blocks (compressed size, encoded block padded to a byte boundary),
+    end of stream marker,
+    footer (index of block offsets and sizes, trailer)
+
+    :param text: the text to encode
+    :param block_size: the number of characters per block
+    :param jobs: the number of worker processes encoding blocks in parallel (None or 0 for every core)
+    :param backend: the suffix array backend used for BWT (see bwt.SUFFIX_ARRAY_BACKENDS)
+    :param coder: the coding stage applied after BWT (see container.CODERS)
+    :return: the container
+    """
+    return b"".join(iter_encoded_parts(split_into_blocks(text, block_size), block_size, jobs, backend, coder))
+
+
+def encode_stream(input_file: BinaryIO, output_file: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE,
+                  jobs: Optional[int] = 1, backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND,
+                  coder: str = DEFAULT_CODER, use_mmap: bool = True) -> None:
     """
-    encoded_length = elias_encode(len(text)+1)  # +1 for dollar symbol
-    bwt_text = bwt_encode_with_ukkonen(text)  # change to bwt_encode_naive(text) see the difference
-    # print("bwt_text")
-    # print(bwt_text)
-    n_unique_chars, encoded_text, encoded_code_table = runlength_encoder(bwt_text)
+    Encode everything read from input_file into a container written to output_file, block by block, so that memory is
+    bounded by a few blocks however large the input is. output_file is never seeked, so it can be a pipe.
+    A regular input file is memory-mapped and each block is decoded straight from the mapping, so only the pages of the
+    blocks being encoded are touched; any other input (e.g. a pipe) is read block by block.
 
-    encoded_length.extend(n_unique_chars)
-    encoded_length.extend(encoded_code_table)
-    encoded_length.extend(encoded_text)
+    :param input_file: the input, opened in binary mode (every byte is one character)
+    :param output_file: where the container is written, opened in binary mode
+    :param use_mmap: whether to memory-map input_file when it is a regular file
+    """
+    if use_mmap and is_mappable(input_file):
+        with map_file(input_file) as data:
+            for encoded_part in iter_encoded_parts(split_buffer_into_blocks(data, block_size), block_size, jobs,
+                                                   backend, coder):
+                output_file.write(encoded_part)
+    else:
+        for encoded_part in iter_encoded_parts(read_text_blocks(input_file, block_size), block_size, jobs, backend,
+                                               coder):
+            output_file.write(encoded_part)
+
+
+class Compressor:
+    """
+    Push-style encoder, like bz2.BZ2Compressor: feed the input to compress as it arrives and call flush at the end.
+
+        compressor = Compressor()
+        for chunk in chunks:
+            output_file.write(compressor.compress(chunk))
+        output_file.write(compressor.flush())
+
+    The input is buffered until a block is full, and each full block is encoded and returned right away, so memory is
+    bounded by the block size and the size of a chunk (plus 16 bytes per block for the index in the footer) however
+    much is compressed.
+    """
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE, backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND,
+                 coder: str = DEFAULT_CODER) -> None:
+        self.block_size: int = block_size
+        self.backend: str = backend
+        self.coder: str = coder
+
+        self.header: bytes = create_header(block_size)  # validates the block size up front
+        self.buffer: bytearray = bytearray()  # the input not encoded yet, shorter than a block between calls
+        self.offset: int = 0  # the number of bytes returned so far
+        self.index: list[BlockIndexEntry] = []
+        self.flushed: bool = False
+
+    def encode_blocks(self, final: bool) -> bytes:
+        """
+        Encode every full block in the buffer (and what is left of it if final), returning the framed blocks.
+        """
+        parts = []
+        if self.offset == 0:
+            parts.append(self.header)
+            self.offset += len(self.header)
+
+        start = 0
+        while len(self.buffer) - start >= self.block_size or (final and start < len(self.buffer)):
+            block = self.buffer[start:start + self.block_size].decode(TEXT_ENCODING)
+            original_size, framed_block = encode_framed_block(block, self.backend, self.coder)
+            self.index.append(BlockIndexEntry(self.offset + FRAME_N_BYTES, len(framed_block) - FRAME_N_BYTES,
+                                              original_size))
+            parts.append(framed_block)
+            self.offset += len(framed_block)
+            start += original_size
+
+        del self.buffer[:start]
+        return b"".join(parts)
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        :param data: the next piece of the input (every byte is one character)
+        :return: the next piece of the container, possibly empty while a block is being filled
+        """
+        if self.flushed:
+            raise ValueError("compressor has been flushed")
+
+        self.buffer += data
+        return self.encode_blocks(final=False)
+
+    def flush(self) -> bytes:
+        """
+        Finish the container: encode the last (partial) block, then the end of stream marker and footer.
 
-    encoded_text = pad_by_zeroes(encoded_length)
+        :return: the rest of the container
+        """
+        if self.flushed:
+            raise ValueError("repeated call to flush()")
 
-    return encoded_text
+        self.flushed = True
+        tail = self.encode_blocks(final=True)
+        return tail + END_OF_STREAM + create_footer(self.index, self.offset + len(END_OF_STREAM))
+
+
+def append_blocks(container_file: BinaryIO, blocks: Iterable[str], index: list[BlockIndexEntry], end_offset: int,
+                  jobs: Optional[int] = 1, backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND,
+                  coder: str = DEFAULT_CODER) -> None:
+    """
+    Write new blocks over the end of stream marker of a container (see container.read_append_point), then a new end
+    of stream marker and footer, and cut off what is left of the old footer.
+    """
+    container_file.seek(end_offset)
+    for encoded_part in iter_encoded_tail(blocks, index, end_offset, jobs, backend, coder):
+        container_file.write(encoded_part)
+    container_file.truncate()
+
+
+def append(container_file: BinaryIO, text: str, jobs: Optional[int] = 1,
+           backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND, coder: str = DEFAULT_CODER) -> None:
+    """
+    Append text to a container file so that it decodes to its old text followed by text. Only text is encoded, into
+    new blocks of the block size of the container; the existing blocks are neither read nor rewritten, so the cost is
+    proportional to the length of text. Only the end of stream marker and footer are rewritten, so the container is
+    left without a footer if the append is interrupted.
+
+    :param container_file: a container opened for reading and writing in binary mode ("r+b")
+    :param text: the text to append
+    """
+    block_size, index, end_offset = read_append_point(container_file)
+    append_blocks(container_file, split_into_blocks(text, block_size), index, end_offset, jobs, backend, coder)
+
+
+def append_stream(input_file: BinaryIO, container_file: BinaryIO, jobs: Optional[int] = 1,
+                  backend: str = DEFAULT_SUFFIX_ARRAY_BACKEND, coder: str = DEFAULT_CODER,
+                  use_mmap: bool = True) -> None:
+    """
+    Append everything read from input_file to a container file block by block (see append and encode_stream).
+
+    :param input_file: the input, opened in binary mode (every byte is one character)
+    :param container_file: a container opened for reading and writing in binary mode ("r+b")
+    :param use_mmap: whether to memory-map input_file when it is a regular file
+    """
+    block_size, index, end_offset = read_append_point(container_file)
+    if use_mmap and is_mappable(input_file):
+        with map_file(input_file) as data:
+            append_blocks(container_file, split_buffer_into_blocks(data, block_size), index, end_offset, jobs,
+                          backend, coder)
+    else:
+        append_blocks(container_file, read_text_blocks(input_file, block_size), index, end_offset, jobs, backend,
+                      coder)
 
 
 if __name__ == "__main__":
-    _, text_filename = sys.argv
+    parser = argparse.ArgumentParser(description="Zip a file (or stdin) into a bwtzip container")
+    parser.add_argument("filename", nargs="?", default=STDIO_PATH,
+                        help="file to zip, or - to read stdin (default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="where to write the container, or - for stdout "
+                             "(default: bwtencoded.bin, or stdout when reading stdin)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="number of characters per block (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes encoding blocks in parallel, 0 for every core "
+                             "(default: %(default)s)")
+    parser.add_argument("--suffix-array", choices=list(SUFFIX_ARRAY_BACKENDS), default=DEFAULT_SUFFIX_ARRAY_BACKEND,
+                        help="suffix array backend used for BWT (default: %(default)s)")
+    parser.add_argument("--coder", choices=list(CODERS), default=DEFAULT_CODER,
+                        help="coding stage after BWT: run length + huffman, or move-to-front + zero run + huffman "
+                             "(default: %(default)s)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write the time, calls and bytes in/out of each stage as JSON to PATH "
+                             "(stages in worker processes are not recorded, use --jobs 1)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also record the peak memory of each stage with tracemalloc (slow)")
+    parser.add_argument("--no-mmap", action="store_true",
+                        help="read the input file block by block instead of memory-mapping it")
+    parser.add_argument("-a", "--append", action="store_true",
+                        help="append to the container instead of overwriting it (created if missing); only the new "
+                             "input is encoded, with the block size of the container")
+    args = parser.parse_args()
 
-    with open(text_filename, "r") as file:
-        text = file.readline()
+    output_filename = args.output
+    if output_filename is None:
+        output_filename = STDIO_PATH if args.filename == STDIO_PATH else "bwtencoded.bin"
+    if args.append and output_filename == STDIO_PATH:
+        parser.error("--append needs a container file to rewrite the footer of, not stdout")
 
-    encoded_text = encoder(text)
-    output_filename = "bwtencoded.bin"
+    profiler = Profiler(trace_memory=args.profile_memory)
+    with profiler if args.profile is not None else nullcontext():
+        if args.append and os.path.exists(output_filename):
+            with open_input(args.filename) as input_file, open(output_filename, "r+b") as container_file:
+                append_stream(input_file, container_file, args.jobs, args.suffix_array, args.coder,
+                              use_mmap=not args.no_mmap)
+        else:
+            with open_input(args.filename) as input_file, open_output(output_filename) as output_file:
+                encode_stream(input_file, output_file, args.block_size, args.jobs, args.suffix_array, args.coder,
+                              use_mmap=not args.no_mmap)
 
-    with open(output_filename, "wb") as file:
-        file.write(encoded_text.tobytes())
+    if args.profile is not None:
+        with open(args.profile, "w") as file:
+            file.write(profiler.to_json())
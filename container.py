@@ -0,0 +1,307 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "The implementation of the block-based container format"
+
+from typing import BinaryIO, Iterator
+
+from utilities import TEXT_ENCODING
+
+MAGIC = b"BWZ"
+FORMAT_VERSION = 6
+
+# bzip2-style block sizes (100k - 900k characters per block)
+MIN_BLOCK_SIZE, MAX_BLOCK_SIZE = 100_000, 900_000
+DEFAULT_BLOCK_SIZE = MIN_BLOCK_SIZE
+
+# the coding stage applied to the BWT text of each block, stored in the block
+CODERS = {"runlength": 0, "mtf": 1}  # run length (elias) + huffman; move-to-front + zero run (RUNA/RUNB) + huffman
+CODER_N_BITS = 2
+DEFAULT_CODER = "mtf"
+
+BLOCK_SIZE_N_BYTES = 4  # the block size stored in the header
+HEADER_N_BYTES = len(MAGIC) + 1 + BLOCK_SIZE_N_BYTES
+FRAME_N_BYTES = 4  # the compressed size stored in front of each block
+END_OF_STREAM = bytes(FRAME_N_BYTES)  # a block with compressed size 0 terminates the stream
+
+FOOTER_MAGIC = b"BWZI"
+OFFSET_N_BYTES = 8  # byte offsets into the container
+SIZE_N_BYTES = 4  # compressed and original sizes of a block
+INDEX_ENTRY_N_BYTES = OFFSET_N_BYTES + 2 * SIZE_N_BYTES
+TRAILER_N_BYTES = OFFSET_N_BYTES + SIZE_N_BYTES + len(FOOTER_MAGIC)
+
+
+class BlockIndexEntry:
+    """
+    Represent where a block is in the container, used to decode blocks independently of each other.
+    """
+    def __init__(self, offset: int, compressed_size: int, original_size: int) -> None:
+        self.offset: int = offset  # the byte offset of the encoded block (after its frame)
+        self.compressed_size: int = compressed_size  # the number of bytes of the encoded block
+        self.original_size: int = original_size  # the number of characters the block decodes to
+
+    def get_payload(self, data: bytes) -> bytes:
+        """
+        Slice the encoded block out of the container (a view if data is a memoryview, without copying).
+        """
+        return data[self.offset:self.offset + self.compressed_size]
+
+    def __str__(self) -> str:
+        return str((self.offset, self.compressed_size, self.original_size))
+
+
+def block_size_from_level(level: int) -> int:
+    """
+    Convert a bzip2-style compression level (1-9) into a block size.
+    """
+    if not 1 <= level <= 9:
+        raise ValueError("level must be between 1 and 9")
+
+    return level * MIN_BLOCK_SIZE
+
+
+def validate_block_size(block_size: int) -> None:
+    # smaller blocks are allowed (mainly for testing); larger ones are not since memory is bounded by the block size
+    if not 0 < block_size <= MAX_BLOCK_SIZE:
+        raise ValueError(f"block size must be between 1 and {MAX_BLOCK_SIZE}")
+
+
+def split_into_blocks(text: str, block_size: int) -> Iterator[str]:
+    """
+    Cut the text into consecutive blocks of block_size characters (the last one can be shorter).
+    """
+    for start in range(0, len(text), block_size):
+        yield text[start:start + block_size]
+
+
+def split_buffer_into_blocks(data: memoryview, block_size: int) -> Iterator[str]:
+    """
+    Cut a bytes-like buffer (e.g. a memory-mapped file) into blocks of block_size characters, decoding one block at a
+    time (see utilities.TEXT_ENCODING) straight from the buffer.
+    """
+    for start in range(0, len(data), block_size):
+        yield str(data[start:start + block_size], TEXT_ENCODING)
+
+
+def read_text_blocks(file: BinaryIO, block_size: int) -> Iterator[str]:
+    """
+    Read a file (or a pipe) block by block, so that only one block of the input is held in memory at a time.
+    Every byte becomes one character (see utilities.TEXT_ENCODING).
+    """
+    while True:
+        chunk = file.read(block_size)
+        if not chunk:
+            return
+        yield chunk.decode(TEXT_ENCODING)
+
+
+def create_header(block_size: int) -> bytes:
+    """
+    header format:
+    magic (3 bytes),
+    format version (1 byte),
+    block size (4 bytes, big endian)
+    """
+    validate_block_size(block_size)
+    return MAGIC + bytes([FORMAT_VERSION]) + block_size.to_bytes(BLOCK_SIZE_N_BYTES, byteorder="big")
+
+
+def read_header(data: bytes) -> tuple[int, int]:
+    """
+    Validate the header of a container.
+
+    :param data: the whole container
+    :return: the block size, and the offset at which the first block starts
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a bwtzip container (bad magic)")
+
+    version_offset = len(MAGIC)
+    if len(data) < HEADER_N_BYTES:
+        raise ValueError("truncated header")
+
+    version = data[version_offset]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported format version {version} (expected {FORMAT_VERSION})")
+
+    block_size_offset = version_offset + 1
+    block_size = int.from_bytes(data[block_size_offset:block_size_offset + BLOCK_SIZE_N_BYTES], byteorder="big")
+
+    return block_size, HEADER_N_BYTES
+
+
+def frame_block(payload: bytes) -> bytes:
+    """
+    Prepend the compressed size to an encoded block so that a decoder can find where the next block starts.
+    """
+    assert len(payload) > 0, "an encoded block is never empty"
+    return len(payload).to_bytes(FRAME_N_BYTES, byteorder="big") + payload
+
+
+def create_footer(index: list[BlockIndexEntry], index_offset: int) -> bytes:
+    """
+    footer format:
+    index (for each block: offset (8 bytes), compressed size (4 bytes), original size (4 bytes)),
+    trailer (index offset (8 bytes), number of blocks (4 bytes), footer magic (4 bytes))
+
+    :param index: the index entries, in the order of the blocks
+    :param index_offset: the byte offset at which the footer starts
+    """
+    footer_parts = []
+    for entry in index:
+        footer_parts.append(entry.offset.to_bytes(OFFSET_N_BYTES, byteorder="big"))
+        footer_parts.append(entry.compressed_size.to_bytes(SIZE_N_BYTES, byteorder="big"))
+        footer_parts.append(entry.original_size.to_bytes(SIZE_N_BYTES, byteorder="big"))
+
+    footer_parts.append(index_offset.to_bytes(OFFSET_N_BYTES, byteorder="big"))
+    footer_parts.append(len(index).to_bytes(SIZE_N_BYTES, byteorder="big"))
+    footer_parts.append(FOOTER_MAGIC)
+
+    return b"".join(footer_parts)
+
+
+def read_trailer(trailer: bytes, container_size: int) -> tuple[int, int]:
+    """
+    Read the fixed-size trailer at the very end of a container.
+
+    :param trailer: the last TRAILER_N_BYTES bytes of the container
+    :param container_size: the size of the whole container in bytes
+    :return: the byte offset of the index, and the number of blocks
+    """
+    if len(trailer) != TRAILER_N_BYTES or trailer[OFFSET_N_BYTES + SIZE_N_BYTES:] != FOOTER_MAGIC:
+        raise ValueError("missing block index (bad footer magic)")
+
+    index_offset = int.from_bytes(trailer[:OFFSET_N_BYTES], byteorder="big")
+    n_blocks = int.from_bytes(trailer[OFFSET_N_BYTES:OFFSET_N_BYTES + SIZE_N_BYTES], byteorder="big")
+
+    if index_offset + n_blocks * INDEX_ENTRY_N_BYTES != container_size - TRAILER_N_BYTES:
+        raise ValueError("corrupted block index")
+
+    return index_offset, n_blocks
+
+
+def read_index_entries(index_data: bytes, index_offset: int) -> list[BlockIndexEntry]:
+    """
+    Read the index entries that sit between index_offset and the trailer.
+
+    :param index_data: the bytes of the index (without the trailer)
+    :param index_offset: the byte offset at which the index starts; no block can extend past it
+    :return: the index entries, in the order of the blocks
+    """
+    index = []
+    for entry_offset in range(0, len(index_data), INDEX_ENTRY_N_BYTES):
+        offset = int.from_bytes(index_data[entry_offset:entry_offset + OFFSET_N_BYTES], byteorder="big")
+        entry_offset += OFFSET_N_BYTES
+        compressed_size = int.from_bytes(index_data[entry_offset:entry_offset + SIZE_N_BYTES], byteorder="big")
+        entry_offset += SIZE_N_BYTES
+        original_size = int.from_bytes(index_data[entry_offset:entry_offset + SIZE_N_BYTES], byteorder="big")
+
+        if offset + compressed_size > index_offset:
+            raise ValueError("corrupted block index")
+
+        index.append(BlockIndexEntry(offset, compressed_size, original_size))
+
+    return index
+
+
+def read_index(data: bytes) -> list[BlockIndexEntry]:
+    """
+    Read the block index from the footer at the end of a container.
+
+    :param data: the whole container
+    :return: the index entries, in the order of the blocks
+    """
+    if len(data) < TRAILER_N_BYTES:
+        raise ValueError("missing block index (bad footer magic)")
+
+    trailer_offset = len(data) - TRAILER_N_BYTES
+    index_offset, _ = read_trailer(data[trailer_offset:], len(data))
+
+    return read_index_entries(data[index_offset:trailer_offset], index_offset)
+
+
+def read_index_from_file(file: BinaryIO) -> list[BlockIndexEntry]:
+    """
+    Read the block index of a container file by seeking to its footer, without reading any block.
+
+    :param file: a container opened in binary mode
+    :return: the index entries, in the order of the blocks
+    """
+    file.seek(0)
+    read_header(file.read(HEADER_N_BYTES))
+
+    container_size = file.seek(0, 2)
+    if container_size < TRAILER_N_BYTES:
+        raise ValueError("missing block index (bad footer magic)")
+
+    file.seek(container_size - TRAILER_N_BYTES)
+    index_offset, n_blocks = read_trailer(file.read(TRAILER_N_BYTES), container_size)
+
+    file.seek(index_offset)
+    return read_index_entries(file.read(n_blocks * INDEX_ENTRY_N_BYTES), index_offset)
+
+
+def read_append_point(file: BinaryIO) -> tuple[int, list[BlockIndexEntry], int]:
+    """
+    Find where new blocks go in a container file: they overwrite its end of stream marker and footer, which are
+    written again after them, while the blocks already there are left untouched.
+
+    :param file: a container opened in binary mode
+    :return: the block size, the index entries, and the byte offset of the end of stream marker
+    """
+    file.seek(0)
+    block_size, end_offset = read_header(file.read(HEADER_N_BYTES))
+    index = read_index_from_file(file)
+    if index:
+        end_offset = index[-1].offset + index[-1].compressed_size
+
+    container_size = file.seek(0, 2)
+    file.seek(end_offset)
+    if file.read(FRAME_N_BYTES) != END_OF_STREAM or \
+            end_offset + FRAME_N_BYTES + len(index) * INDEX_ENTRY_N_BYTES + TRAILER_N_BYTES != container_size:
+        raise ValueError("corrupted container (no end of stream marker before the footer)")
+
+    return block_size, index, end_offset
+
+
+def read_footer(footer: bytes) -> list[BlockIndexEntry]:
+    """
+    Read the block index from the footer alone (everything after the end of stream marker), for a container that is
+    read sequentially. The footer starts with the index, so the container ends len(footer) bytes after the index offset.
+
+    :param footer: the bytes that follow the end of stream marker
+    :return: the index entries, in the order of the blocks
+    """
+    if len(footer) < TRAILER_N_BYTES:
+        raise ValueError("missing block index (bad footer magic)")
+
+    trailer_offset = len(footer) - TRAILER_N_BYTES
+    index_offset = int.from_bytes(footer[trailer_offset:trailer_offset + OFFSET_N_BYTES], byteorder="big")
+    read_trailer(footer[trailer_offset:], index_offset + len(footer))
+
+    return read_index_entries(footer[:trailer_offset], index_offset)
+
+
+def read_payload_from_file(file: BinaryIO, entry: BlockIndexEntry) -> bytes:
+    file.seek(entry.offset)
+    return file.read(entry.compressed_size)
+
+
+def iter_payloads_from_file(file: BinaryIO) -> Iterator[bytes]:
+    """
+    Yield the payload of each framed block, reading the file sequentially from the current position until the end of
+    stream marker. Unlike read_index_from_file it never seeks, so it also works on a pipe.
+    """
+    while True:
+        frame = file.read(FRAME_N_BYTES)
+        if len(frame) < FRAME_N_BYTES:
+            raise ValueError("truncated container (missing end of stream marker)")
+
+        payload_size = int.from_bytes(frame, byteorder="big")
+        if payload_size == 0:
+            return
+
+        payload = file.read(payload_size)
+        if len(payload) < payload_size:
+            raise ValueError("truncated block")
+
+        yield payload
@@ -2,76 +2,131 @@ __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 __description__ = "The implementation of Elias encoder and decoder"
 
-from original_bitarray import BitArray
+from array import array
 
+from bitstream import BitReader, BitWriter
 
-def elias_encode(num: int) -> BitArray:
+
+ELIAS_TABLE_BITS = 16  # the codes of 1..2^16-1 are precomputed, which covers almost every run length
+
+
+def build_elias_table(table_bits: int) -> tuple[array, array]:
     """
-    Implementation of Elias encoder.
+    Precompute the code of every integer below 2^table_bits.
+    The code of num is the code of (length of num)-1 with the first bit of its last component set to 0, followed by
+    the binary of num, so each code is built from a shorter one that is already in the table.
 
-    :param num: a positive integer to encode
-    :return: encoded text in BitArray
+    :time complexity: O(2^table_bits)
+    :return: the code of each integer (as an integer), and its length in bits
     """
-    assert num > 0, "elias encode does not support 0 and negative numbers"
+    codes = array("Q", [0]) * (1 << table_bits)
+    code_lengths = array("B", [0]) * (1 << table_bits)
+    codes[1], code_lengths[1] = 1, 1
+
+    for num in range(2, 1 << table_bits):
+        num_length = num.bit_length()
+        prefix_num = num_length-1
+        prefix = codes[prefix_num] ^ (1 << (prefix_num.bit_length()-1))
+        codes[num] = (prefix << num_length) | num
+        code_lengths[num] = code_lengths[prefix_num] + num_length
+
+    return codes, code_lengths
+
+
+ELIAS_CODES, ELIAS_CODE_LENGTHS = build_elias_table(ELIAS_TABLE_BITS)
+
+ELIAS_DECODE_TABLE_BITS = 12  # codes up to this length (every integer below 64) are decoded with a single lookup
+
+
+def build_elias_decode_table(table_bits: int) -> tuple[array, array]:
+    """
+    Map every table_bits-bit prefix to the integer whose code it starts with, and the length of that code.
+    Codes are prefix-free, so each code of length l fills the 2^(table_bits-l) entries that start with it.
+    Prefixes that do not start with a complete code keep length 0.
 
-    components = []
+    :time complexity: O(2^table_bits)
+    :return: the integer of each prefix, and the length of its code (0 if the code is longer than table_bits)
+    """
+    values = array("i", [0]) * (1 << table_bits)
+    code_lengths = array("B", [0]) * (1 << table_bits)
 
-    # convert num to binary
-    current = decimal_to_bitarray(num)
-    components.append(current)
+    # code lengths never decrease with the integer
+    num = 1
+    while ELIAS_CODE_LENGTHS[num] <= table_bits:
+        n_free_bits = table_bits - ELIAS_CODE_LENGTHS[num]
+        first_entry = ELIAS_CODES[num] << n_free_bits
+        for entry in range(first_entry, first_entry + (1 << n_free_bits)):
+            values[entry] = num
+            code_lengths[entry] = ELIAS_CODE_LENGTHS[num]
+        num += 1
 
-    # start encoding backward
-    component_length = len(current)
-    while component_length > 1:
-        component = decimal_to_bitarray(component_length-1)
-        component.set_first_bit_to_zero()
-        components.append(component)
-        component_length = len(component)
+    return values, code_lengths
 
-    # concatenating the components
-    encoded_num = components[-1]
-    for i in range(len(components)-2, -1, -1):
-        component = components[i]
-        encoded_num.extend(component)
 
-    return encoded_num
+ELIAS_DECODE_VALUES, ELIAS_DECODE_LENGTHS = build_elias_decode_table(ELIAS_DECODE_TABLE_BITS)
 
 
-def decimal_to_bitarray(num: int) -> BitArray:
+def elias_code(num: int) -> tuple[int, int]:
     """
-    Convert from decimal to bitarray
-    :time complexity: O(num digits)
+    Return the Elias code of num as an integer, and its length in bits.
+    Small integers are looked up in the precomputed table; the prefix of a larger integer is the code of its length,
+    which is small again.
+
+    :time complexity: O(1) for num < 2^ELIAS_TABLE_BITS, otherwise O(length of the code)
+    :param num: a positive integer
     """
-    result = BitArray()
+    if num < len(ELIAS_CODES):
+        return ELIAS_CODES[num], ELIAS_CODE_LENGTHS[num]
 
-    while num != 0:
-        result.append(num & 1)
-        num >>= 1
+    num_length = num.bit_length()
+    prefix_num = num_length-1
+    prefix, prefix_length = elias_code(prefix_num)
+    prefix ^= 1 << (prefix_num.bit_length()-1)
+    return (prefix << num_length) | num, prefix_length + num_length
 
-    result.reverse()
-    return result
 
+def elias_encode(num: int, bits: BitWriter) -> None:
+    """
+    Implementation of Elias encoder.
+    Writes the code of num at the end of the stream.
 
-def elias_decode(bits: BitArray) -> tuple[int, BitArray]:
+    :time complexity: O(1) for num < 2^ELIAS_TABLE_BITS, otherwise O(length of the code)
+    :param num: a positive integer to encode
+    :param bits: bit writer to write the code into
+    """
+    assert num > 0, "elias encode does not support 0 and negative numbers"
+
+    if num < len(ELIAS_CODES):
+        bits.write_bits(ELIAS_CODES[num], ELIAS_CODE_LENGTHS[num])
+    else:
+        bits.write_bits(*elias_code(num))
+
+
+def elias_decode(bits: BitReader) -> int:
     """
     Implementation of Elias decoder.
+    Reads one Elias code from the stream and leaves the cursor right after it.
+    Short codes are resolved with one peek and one lookup; longer ones are read component by component.
 
-    :param bits: bitarray encoded with Elias encoder
-    :return: the original integer, and any remained bitarray portion
+    :time complexity: O(1) for codes up to ELIAS_DECODE_TABLE_BITS bits, otherwise O(length of the code)
+    :param bits: bit reader positioned at the start of an Elias code
+    :return: the original integer
     """
-    if len(bits) == 1:
-        return 1, BitArray()
-    start, end = 0, 1
+    prefix = bits.peek_bits(ELIAS_DECODE_TABLE_BITS)
+    code_length = ELIAS_DECODE_LENGTHS[prefix]
+    if code_length:
+        bits.skip_bits(code_length)
+        return ELIAS_DECODE_VALUES[prefix]
+
+    component_length = 1
 
     while True:
-        component = bits[start:end]
-        if component[0] == 1:
+        component = bits.read_bits(component_length)
+        if component >> (component_length-1) == 1:
             break
 
-        component.set_first_bit_to_one()
-        start = end
-        end = start + component.to_decimal()+1
-
-    remainder = bits[end:]  # note: this process is constant (see the implementation)
+        # set the first bit to one to get the length of the next component
+        component |= 1 << (component_length-1)
+        component_length = component+1
 
-    return component.to_decimal(), remainder
+    return component
@@ -0,0 +1,362 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "FM-index pattern search (count, locate, extract) over the BWT stored in a container"
+
+import argparse
+import os
+from array import array
+from bisect import bisect_left
+from typing import Optional
+
+from bwt import compute_lf_mapping
+from bwtunzip import decode_payload_bwt
+from container import BlockIndexEntry, read_header, read_index
+from parallel import ordered_parallel_map
+from utilities import MIN_ASCII, MAX_ASCII, SENTINEL, STDIO_PATH, TEXT_ENCODING, map_file, open_output
+
+
+DEFAULT_RANK_SAMPLE_RATE = 256  # a rank checkpoint every 256 positions of L
+DEFAULT_SA_SAMPLE_RATE = 32  # the suffix array is kept for every 32nd text position (for locate)
+DEFAULT_ISA_SAMPLE_RATE = 64  # the inverse suffix array is kept for every 64th text position (for extract)
+
+
+class BlockFMIndex:
+    """
+    A low-memory FM-index over the BWT text of one block.
+
+    Backward search only needs, for each character c, C[c] (the first row starting with c) and occ(c, i) (the number
+    of c in L[:i]). L is stored as bytes (1 byte per character, with the row of "$" kept aside), and occ is answered
+    from a rank checkpoint every rank_sample_rate positions (the counts of each character used by the block up to
+    there) plus a count over at most rank_sample_rate bytes of L after the checkpoint.
+
+    locate and extract need positions in the text. Only the suffix array entries of every sa_sample_rate-th text
+    position are kept: from any row, walking LF reaches a sampled row within sa_sample_rate steps, and the position
+    is the sampled one plus the number of steps. The inverse suffix array of every isa_sample_rate-th text position
+    gives extract a row to start walking from.
+
+    memory: about 1 + 4 * sigma / rank_sample_rate + 8 / sa_sample_rate + 4 / isa_sample_rate bytes per character,
+    where sigma is the number of distinct characters of the block
+    """
+
+    def __init__(self, bwt_text: str, rank_sample_rate: int = DEFAULT_RANK_SAMPLE_RATE,
+                 sa_sample_rate: Optional[int] = DEFAULT_SA_SAMPLE_RATE,
+                 isa_sample_rate: int = DEFAULT_ISA_SAMPLE_RATE) -> None:
+        """
+        :param bwt_text: the BWT text of the block (with "$")
+        :param rank_sample_rate: the distance between rank checkpoints; lower is faster and bigger
+        :param sa_sample_rate: the distance between text positions whose suffix array entry is kept; lower makes locate
+                               faster and the index bigger. None keeps none, when only count and extract are needed
+        :param isa_sample_rate: the distance between text positions whose row is kept; lower makes extract faster and
+                                the index bigger
+        """
+        if rank_sample_rate < 1 or isa_sample_rate < 1 or (sa_sample_rate is not None and sa_sample_rate < 1):
+            raise ValueError("sample rates must be positive")
+
+        self.n: int = len(bwt_text)  # the length of the text + 1 for "$"
+        self.rank_sample_rate: int = rank_sample_rate
+        self.sa_sample_rate: Optional[int] = sa_sample_rate
+        self.isa_sample_rate: int = isa_sample_rate
+
+        # L as bytes; the "$" row holds a 0 byte, which occ corrects for
+        self.sentinel_row: int = bwt_text.index(SENTINEL)
+        self.bwt_bytes: bytes = bwt_text.replace(SENTINEL, "\0").encode(TEXT_ENCODING)
+
+        # only the characters used by the block get a column in the rank checkpoints
+        counts = [self.bwt_bytes.count(byte) for byte in range(MAX_ASCII - MIN_ASCII + 1)]
+        counts[0] -= 1  # the "$" row
+        self.used_bytes: bytes = bytes(byte for byte in range(len(counts)) if counts[byte])
+        self.column: list[int] = [-1] * len(counts)  # the column of each used byte
+        for column, byte in enumerate(self.used_bytes):
+            self.column[byte] = column
+
+        self.first_row: list[int] = [0] * len(counts)  # C[c]; row 0 is the suffix "$"
+        row = 1
+        for byte in range(len(counts)):
+            self.first_row[byte] = row
+            row += counts[byte]
+
+        # ranks[j * sigma + column] = the number of used_bytes[column] in L[:j * rank_sample_rate], "$" excluded
+        sigma = len(self.used_bytes)
+        n_checkpoints = self.n // rank_sample_rate + 1
+        self.ranks: array = array("i", [0]) * (n_checkpoints * sigma)
+        for column, byte in enumerate(self.used_bytes):
+            rank = 0
+            for j in range(1, n_checkpoints):
+                rank += self.bwt_bytes.count(byte, (j-1) * rank_sample_rate, j * rank_sample_rate)
+                if byte == 0 and (j-1) * rank_sample_rate <= self.sentinel_row < j * rank_sample_rate:
+                    rank -= 1
+                self.ranks[j * sigma + column] = rank
+
+        # walk LF once from the row of "$" (the suffix at position n-1) to sample the suffix array and its inverse
+        # inverse_samples[p // isa_sample_rate] = the row of text position p
+        self.inverse_samples: array = array("i", [0]) * ((self.n - 1) // isa_sample_rate + 1)
+        samples = []
+        lf = compute_lf_mapping(bwt_text)
+        row = 0
+        for position in range(self.n - 1, -1, -1):
+            if position % isa_sample_rate == 0:
+                self.inverse_samples[position // isa_sample_rate] = row
+            if sa_sample_rate is not None and position % sa_sample_rate == 0:
+                samples.append((row, position))
+            row = lf[row]
+
+        # the sampled rows in increasing order (searched with bisect), and the text position of each
+        samples.sort()
+        self.sampled_rows: array = array("i", (row for row, _ in samples))
+        self.sampled_positions: array = array("i", (position for _, position in samples))
+
+    def __len__(self) -> int:
+        """
+        The number of characters of the block (without "$").
+        """
+        return self.n - 1
+
+    def memory_bytes(self) -> int:
+        """
+        The size of the arrays of the index in bytes.
+        """
+        return (len(self.bwt_bytes) + self.ranks.itemsize * len(self.ranks)
+                + self.sampled_rows.itemsize * len(self.sampled_rows)
+                + self.sampled_positions.itemsize * len(self.sampled_positions)
+                + self.inverse_samples.itemsize * len(self.inverse_samples))
+
+    def occ(self, byte: int, i: int) -> int:
+        """
+        The number of a byte in L[:i] ("$" excluded).
+
+        :time complexity: O(rank_sample_rate), a count over the bytes after the last checkpoint
+        """
+        column = self.column[byte]
+        if column < 0:
+            return 0
+
+        checkpoint = i // self.rank_sample_rate
+        checkpoint_start = checkpoint * self.rank_sample_rate
+        rank = self.ranks[checkpoint * len(self.used_bytes) + column] + self.bwt_bytes.count(byte, checkpoint_start, i)
+        if byte == 0 and checkpoint_start <= self.sentinel_row < i:
+            rank -= 1
+
+        return rank
+
+    def lf(self, row: int) -> int:
+        """
+        The row of the suffix that starts one character before the suffix of row.
+        """
+        if row == self.sentinel_row:
+            return 0  # the suffix at position 0 is preceded by "$", the last suffix
+
+        byte = self.bwt_bytes[row]
+        return self.first_row[byte] + self.occ(byte, row)
+
+    def backward_search(self, pattern: str) -> tuple[int, int]:
+        """
+        Find the rows whose suffixes start with pattern, extending the match one character to the left at a time.
+
+        :time complexity: O(m * rank_sample_rate) where m = len(pattern)
+        :return: the range of rows [lo, hi) (empty if pattern does not occur)
+        """
+        lo, hi = 0, self.n
+        for char in reversed(pattern):
+            if char == SENTINEL or not MIN_ASCII <= ord(char) <= MAX_ASCII:
+                return 0, 0
+
+            byte = ord(char)
+            lo = self.first_row[byte] + self.occ(byte, lo)
+            hi = self.first_row[byte] + self.occ(byte, hi)
+            if lo >= hi:
+                return 0, 0
+
+        return lo, hi
+
+    def count(self, pattern: str) -> int:
+        lo, hi = self.backward_search(pattern)
+        return hi - lo
+
+    def position(self, row: int) -> int:
+        """
+        The text position of the suffix of row: walk LF until a sampled row.
+
+        :time complexity: O(sa_sample_rate * rank_sample_rate)
+        """
+        if self.sa_sample_rate is None:
+            raise ValueError("locate needs a sampled suffix array (sa_sample_rate is None)")
+
+        n_steps = 0
+        while True:
+            sample = bisect_left(self.sampled_rows, row)
+            if sample < len(self.sampled_rows) and self.sampled_rows[sample] == row:
+                return self.sampled_positions[sample] + n_steps
+            row = self.lf(row)
+            n_steps += 1
+
+    def locate(self, pattern: str) -> list[int]:
+        """
+        :return: the positions (in the block) where pattern occurs, in increasing order
+        """
+        lo, hi = self.backward_search(pattern)
+        return sorted(self.position(row) for row in range(lo, hi))
+
+    def extract(self, start: int, end: int) -> str:
+        """
+        Recover block[start:end] by walking LF backwards from the first sampled position at or after end.
+
+        :time complexity: O((end - start + isa_sample_rate) * rank_sample_rate)
+        """
+        start = max(start, 0)
+        end = max(min(end, len(self)), start)
+
+        # the suffix "$" (at position n-1) is always row 0, so it can stand in for a sample past the last one
+        sample = -(-end // self.isa_sample_rate)
+        if sample < len(self.inverse_samples):
+            row, position = self.inverse_samples[sample], sample * self.isa_sample_rate
+        else:
+            row, position = 0, self.n - 1
+
+        for _ in range(position - end):
+            row = self.lf(row)
+
+        chars = bytearray()
+        for _ in range(end - start):
+            chars.append(self.bwt_bytes[row])
+            row = self.lf(row)
+
+        chars.reverse()
+        return chars.decode(TEXT_ENCODING)
+
+
+class ArchiveFMIndex:
+    """
+    FM-indexes over every block of a container, searched as one text.
+
+    Each block only has its coding stage undone (see bwtunzip.decode_block_bwt); the BWT is never inverted. An
+    occurrence that crosses a block boundary is invisible to the blocks on either side, so the few characters around
+    each boundary are extracted and searched directly.
+    """
+
+    def __init__(self, data: bytes, jobs: Optional[int] = 1, rank_sample_rate: int = DEFAULT_RANK_SAMPLE_RATE,
+                 sa_sample_rate: Optional[int] = DEFAULT_SA_SAMPLE_RATE,
+                 isa_sample_rate: int = DEFAULT_ISA_SAMPLE_RATE) -> None:
+        """
+        :param data: the whole container
+        :param jobs: the number of worker processes decoding blocks in parallel (None or 0 for every core)
+        :param rank_sample_rate, sa_sample_rate, isa_sample_rate: the sampling of each block, see BlockFMIndex
+        """
+        read_header(data)
+        index: list[BlockIndexEntry] = read_index(data)
+
+        # each BWT text is indexed as soon as it is decoded, so only one of them is held at a time
+        payloads = (bytes(entry.get_payload(data)) for entry in index)
+        self.blocks: list[BlockFMIndex] = [BlockFMIndex(bwt_text, rank_sample_rate, sa_sample_rate, isa_sample_rate)
+                                           for bwt_text in ordered_parallel_map(decode_payload_bwt, payloads, jobs)]
+
+        # the position of the first character of each block in the text
+        self.block_starts: list[int] = [0] * (len(self.blocks) + 1)
+        for i, (entry, block) in enumerate(zip(index, self.blocks)):
+            if len(block) != entry.original_size:
+                raise ValueError("decoded block size does not match the block index")
+            self.block_starts[i + 1] = self.block_starts[i] + len(block)
+
+    def __len__(self) -> int:
+        return self.block_starts[-1]
+
+    def memory_bytes(self) -> int:
+        return sum(block.memory_bytes() for block in self.blocks)
+
+    def crossing_occurrences(self, pattern: str) -> list[int]:
+        """
+        Find the occurrences that cross a block boundary: they start less than len(pattern) characters before it, so
+        only a window of 2 * (len(pattern) - 1) characters around each boundary is extracted and searched.
+
+        :return: the positions (in the whole text) of those occurrences, in increasing order
+        """
+        positions = set()  # an occurrence can cross several boundaries of short blocks
+        for boundary in self.block_starts[1:-1]:
+            window_start = max(boundary - len(pattern) + 1, 0)
+            window = self.extract(window_start, boundary + len(pattern) - 1)
+
+            position = window.find(pattern)
+            while 0 <= position < boundary - window_start:
+                positions.add(window_start + position)
+                position = window.find(pattern, position + 1)
+
+        return sorted(positions)
+
+    def count(self, pattern: str) -> int:
+        """
+        The number of (possibly overlapping) occurrences of pattern, by backward search in each block.
+        """
+        if not pattern:
+            raise ValueError("the pattern must not be empty")
+
+        return sum(block.count(pattern) for block in self.blocks) + len(self.crossing_occurrences(pattern))
+
+    def locate(self, pattern: str) -> list[int]:
+        """
+        :return: the positions (in the whole text) where pattern occurs, in increasing order
+        """
+        if not pattern:
+            raise ValueError("the pattern must not be empty")
+
+        positions = self.crossing_occurrences(pattern)
+        for block_start, block in zip(self.block_starts, self.blocks):
+            positions.extend(block_start + position for position in block.locate(pattern))
+
+        return sorted(positions)
+
+    def extract(self, start: int, end: int) -> str:
+        """
+        Recover text[start:end], only walking the blocks that cover it.
+        """
+        start = max(start, 0)
+        end = max(min(end, len(self)), start)
+        parts = []
+        for block_start, block in zip(self.block_starts, self.blocks):
+            block_end = block_start + len(block)
+            if block_start >= end:
+                break
+            if block_end > start:
+                parts.append(block.extract(start - block_start, end - block_start))
+
+        return "".join(parts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search a bwtzip container without decompressing it")
+    parser.add_argument("filename", help="the container to search")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes decoding blocks in parallel, 0 for every core "
+                             "(default: %(default)s)")
+    parser.add_argument("--rank-sample-rate", type=int, default=DEFAULT_RANK_SAMPLE_RATE,
+                        help="distance between rank checkpoints; lower is faster and uses more memory "
+                             "(default: %(default)s)")
+    parser.add_argument("--sa-sample-rate", type=int, default=DEFAULT_SA_SAMPLE_RATE,
+                        help="distance between sampled suffix array entries, used by locate "
+                             "(default: %(default)s)")
+    parser.add_argument("--isa-sample-rate", type=int, default=DEFAULT_ISA_SAMPLE_RATE,
+                        help="distance between sampled inverse suffix array entries, used by extract "
+                             "(default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("count", help="print the number of occurrences of PATTERN").add_argument("pattern")
+    commands.add_parser("locate", help="print the position of every occurrence of PATTERN").add_argument("pattern")
+    extract_parser = commands.add_parser("extract", help="write the characters from START (inclusive) to END "
+                                                         "(exclusive) to stdout")
+    extract_parser.add_argument("start", type=int)
+    extract_parser.add_argument("end", type=int)
+    args = parser.parse_args()
+
+    with open(args.filename, "rb") as file, map_file(file) as data:
+        # count and extract never look at the suffix array samples, so they are not built
+        sa_sample_rate = args.sa_sample_rate if args.command == "locate" else None
+        fm_index = ArchiveFMIndex(data, args.jobs, args.rank_sample_rate, sa_sample_rate, args.isa_sample_rate)
+
+    if args.command == "extract":
+        with open_output(STDIO_PATH) as output_file:
+            output_file.write(fm_index.extract(args.start, args.end).encode(TEXT_ENCODING))
+    else:
+        # match the bytes of the pattern as given on the command line, the same way the file was read
+        pattern = os.fsencode(args.pattern).decode(TEXT_ENCODING)
+        if args.command == "count":
+            print(fm_index.count(pattern))
+        else:
+            for position in fm_index.locate(pattern):
+                print(position)
@@ -0,0 +1,260 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "The implementation of canonical Huffman codes and their compact header"
+
+from array import array
+from typing import Optional
+
+from elias import elias_encode, elias_decode
+from original_bitarray import BitArray
+from bitstream import BitReader, BitWriter
+
+SYMBOL_GROUP_SIZE = 16  # the symbols-in-use bitmap is split into groups of 16 symbols (same as bzip2)
+
+MAX_CODE_LENGTH = 15  # no code is longer than this, so every code fits a fixed-width peek
+PRIMARY_TABLE_BITS = 10  # codes up to this length are resolved with a single lookup
+
+DELTA_END = 0b0  # finished adjusting the code length of the current symbol
+DELTA_INCREMENT = 0b10
+DELTA_DECREMENT = 0b11
+
+
+def length_limited_code_lengths(freq: list[int], max_length: int = MAX_CODE_LENGTH) -> list[int]:
+    """
+    Compute optimal code lengths under the constraint that no code is longer than max_length (package-merge).
+
+    Each symbol is a coin of width 2^-l for every l in 1..max_length with its frequency as the value. Starting from the
+    deepest level, the cheapest items are paired into packages that are merged with the symbols of the level above.
+    The 2(s-1) cheapest items of the last level form the optimal solution, and the code length of a symbol is the
+    number of those items it is part of.
+
+    :time complexity: O(s^2 * max_length) where s is the number of unique symbols (merging the symbol lists)
+    :param freq: the frequency of each symbol
+    :param max_length: the maximum code length; 2^max_length must be at least the number of unique symbols
+    :return: the code length of each symbol (0 if the symbol does not appear)
+    """
+    code_lengths = [0] * len(freq)
+    leaves = sorted((freq[i], [i]) for i in range(len(freq)) if freq[i])
+    assert len(leaves) <= 1 << max_length, "too many symbols for the maximum code length"
+
+    # a single symbol still needs a 1 bit code
+    if len(leaves) == 1:
+        code_lengths[leaves[0][1][0]] = 1
+        return code_lengths
+
+    items = leaves
+    for _ in range(max_length - 1):
+        packages = [(items[k][0] + items[k + 1][0], items[k][1] + items[k + 1][1]) for k in range(0, len(items) - 1, 2)]
+        items = sorted(leaves + packages, key=lambda item: item[0])
+
+    for _, symbols in items[:2 * (len(leaves) - 1)]:
+        for symbol in symbols:
+            code_lengths[symbol] += 1
+
+    return code_lengths
+
+
+def assign_canonical_codes(code_lengths: list[int]) -> list[Optional[BitArray]]:
+    """
+    Assign canonical Huffman codes: symbols are sorted by (code length, symbol) and get consecutive codes, the code
+    being shifted left whenever the length grows. Only the code lengths are needed to rebuild the codes.
+
+    :time complexity: O(s log s) where s is the number of symbols
+    :param code_lengths: the code length of each symbol (0 if the symbol is not used)
+    :return: an array where each index represents the symbol and its element represents the code word
+    """
+    code_table: list[Optional[BitArray]] = [None] * len(code_lengths)
+    used_symbols = sorted((length, symbol) for symbol, length in enumerate(code_lengths) if length > 0)
+
+    code = 0
+    prev_length = used_symbols[0][0] if used_symbols else 0
+    for length, symbol in used_symbols:
+        code <<= length - prev_length
+        code_table[symbol] = BitArray(code, length)
+        code += 1
+        prev_length = length
+
+    return code_table
+
+
+def write_symbols_in_use(bits: BitWriter, in_use: list[bool]) -> None:
+    """
+    bitmap format (same as bzip2):
+    groups in use (1 bit per group of 16 symbols),
+    symbols in use (16 bits per group in use)
+    """
+    n_groups = (len(in_use) + SYMBOL_GROUP_SIZE - 1) // SYMBOL_GROUP_SIZE
+    groups = [in_use[g * SYMBOL_GROUP_SIZE:(g + 1) * SYMBOL_GROUP_SIZE] for g in range(n_groups)]
+
+    for group in groups:
+        bits.write_bit(1 if any(group) else 0)
+
+    for group in groups:
+        if any(group):
+            for i in range(SYMBOL_GROUP_SIZE):
+                bits.write_bit(1 if i < len(group) and group[i] else 0)
+
+
+def read_symbols_in_use(bits: BitReader, alphabet_size: int) -> list[int]:
+    """
+    Read the bitmap written by write_symbols_in_use.
+
+    :return: the symbols in use, in increasing order
+    """
+    n_groups = (alphabet_size + SYMBOL_GROUP_SIZE - 1) // SYMBOL_GROUP_SIZE
+    used_groups = [g for g in range(n_groups) if bits.read_bit()]
+
+    used_symbols = []
+    for g in used_groups:
+        for i in range(SYMBOL_GROUP_SIZE):
+            if bits.read_bit():
+                used_symbols.append(g * SYMBOL_GROUP_SIZE + i)
+
+    if not used_symbols or used_symbols[-1] >= alphabet_size:
+        raise ValueError("invalid symbols in use")
+
+    return used_symbols
+
+
+def write_code_lengths(bits: BitWriter, code_lengths: list[int]) -> None:
+    """
+    header format:
+    symbols in use (see write_symbols_in_use),
+    first code length (elias),
+    code length deltas (for each following symbol in use: "10" to increment, "11" to decrement, "0" to finish)
+    """
+    write_symbols_in_use(bits, [length > 0 for length in code_lengths])
+
+    used_lengths = [length for length in code_lengths if length > 0]
+    assert used_lengths, "at least one symbol must be used"
+
+    current_length = used_lengths[0]
+    elias_encode(current_length, bits)
+    for length in used_lengths[1:]:
+        while current_length < length:
+            bits.write_bits(DELTA_INCREMENT, 2)
+            current_length += 1
+        while current_length > length:
+            bits.write_bits(DELTA_DECREMENT, 2)
+            current_length -= 1
+        bits.write_bit(DELTA_END)
+
+
+def read_code_lengths(bits: BitReader, alphabet_size: int) -> list[int]:
+    """
+    Read the header written by write_code_lengths.
+
+    :param bits: bit reader positioned at the start of the header
+    :param alphabet_size: the number of symbols
+    :return: the code length of each symbol (0 if the symbol is not used)
+    """
+    used_symbols = read_symbols_in_use(bits, alphabet_size)
+
+    code_lengths = [0] * alphabet_size
+    current_length = elias_decode(bits)
+    code_lengths[used_symbols[0]] = current_length
+    for symbol in used_symbols[1:]:
+        while bits.read_bit() != DELTA_END:
+            current_length += -1 if bits.read_bit() else 1
+        if current_length <= 0:
+            raise ValueError("invalid code length")
+        code_lengths[symbol] = current_length
+
+    return code_lengths
+
+
+class HuffmanDecodeTable:
+    """
+    Lookup tables for canonical Huffman decoding.
+
+    The primary table is indexed by the next primary_bits bits of the stream. Each entry holds the symbol whose code is
+    a prefix of those bits and the length of that code, so most symbols are decoded with one peek and one lookup
+    instead of walking a tree one bit at a time.
+    Entries of codes longer than primary_bits have length 0. Those are resolved with the first-code/offset tables:
+    canonical codes of the same length are consecutive, so a code of length l is
+    sorted_symbols[first_index[l] + code - first_code[l]] if code - first_code[l] < count[l].
+    """
+
+    def __init__(self, primary_bits: int, max_length: int) -> None:
+        self.primary_bits: int = primary_bits
+        self.symbols: array = array("i", [-1]) * (1 << primary_bits)
+        self.lengths: array = array("i", [0]) * (1 << primary_bits)  # 0 means "longer than primary_bits"
+
+        self.max_length: int = max_length
+        self.first_code: list[int] = [0] * (max_length + 1)
+        self.first_index: list[int] = [0] * (max_length + 1)
+        self.count: list[int] = [0] * (max_length + 1)
+        self.sorted_symbols: array = array("i")
+
+
+def build_decode_table(code_lengths: list[int], primary_bits: int = PRIMARY_TABLE_BITS) -> HuffmanDecodeTable:
+    """
+    Create the lookup tables from the code lengths.
+
+    :time complexity: O(2^primary_bits + s log s) where s is the number of symbols
+    :param code_lengths: the code length of each symbol (0 if the symbol is not used)
+    :param primary_bits: the maximum number of bits of the primary table
+    :return: the decode table
+    """
+    max_length = max(code_lengths)
+    table = HuffmanDecodeTable(min(primary_bits, max_length), max_length)
+    primary_bits = table.primary_bits
+
+    # primary table
+    for symbol, code in enumerate(assign_canonical_codes(code_lengths)):
+        if code is None or len(code) > primary_bits:
+            continue
+
+        n_free_bits = primary_bits - len(code)
+        first_entry = code.to_decimal() << n_free_bits
+        for entry in range(first_entry, first_entry + (1 << n_free_bits)):
+            table.symbols[entry] = symbol
+            table.lengths[entry] = len(code)
+
+    # first-code/offset tables
+    for length in code_lengths:
+        table.count[length] += 1
+    table.count[0] = 0
+
+    code, index = 0, 0
+    for length in range(1, max_length + 1):
+        code = (code + table.count[length - 1]) << 1 if length > 1 else 0
+        table.first_code[length] = code
+        table.first_index[length] = index
+        index += table.count[length]
+
+    table.sorted_symbols = array("i", (symbol for _, symbol in
+                                       sorted((length, symbol) for symbol, length in enumerate(code_lengths)
+                                              if length > 0)))
+
+    return table
+
+
+def decode_long_symbol(table: HuffmanDecodeTable, bits: BitReader) -> tuple[int, int]:
+    """
+    Resolve a code longer than the primary table with the first-code/offset tables (without moving the cursor).
+
+    :time complexity: O(max code length - primary_bits)
+    :return: the symbol, and the length of its code
+    """
+    for length in range(table.primary_bits + 1, table.max_length + 1):
+        offset = bits.peek_bits(length) - table.first_code[length]
+        if 0 <= offset < table.count[length]:
+            return table.sorted_symbols[table.first_index[length] + offset], length
+
+    raise ValueError("invalid huffman code")
+
+
+def decode_symbol(table: HuffmanDecodeTable, bits: BitReader) -> int:
+    """
+    Decode one symbol: one peek and one lookup in the primary table, or the first-code/offset tables for long codes.
+    """
+    prefix = bits.peek_bits(table.primary_bits)
+    code_length = table.lengths[prefix]
+    if code_length:
+        symbol = table.symbols[prefix]
+    else:
+        symbol, code_length = decode_long_symbol(table, bits)
+
+    bits.skip_bits(code_length)
+    return symbol
@@ -0,0 +1,339 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "The implementation of move-to-front and zero run (RUNA/RUNB) encoder and decoder"
+
+from collections import Counter
+
+from bitstream import BitReader, BitWriter
+from elias import elias_encode, elias_decode
+from profiling import profile_stage
+from huffman import assign_canonical_codes, build_decode_table, decode_symbol, read_code_lengths, \
+    read_symbols_in_use, write_code_lengths, write_symbols_in_use
+from runlength_encoder import huffman_code_lengths
+from utilities import MIN_ASCII, MAX_ASCII, hash_char, hash_back_tochar
+
+# zero runs are written in bijective base 2 with these two digits (the least significant digit first)
+RUNA, RUNB = 0, 1
+
+# the symbols are cut into groups of GROUP_SIZE symbols, and each group is coded with one of several huffman tables
+GROUP_SIZE = 50
+MIN_TABLES, MAX_TABLES = 2, 6
+N_TABLE_ITERATIONS = 4  # the number of refinement passes over the groups (same as bzip2)
+CHEAP_COST, EXPENSIVE_COST = 0, 15  # the initial cost of a symbol inside/outside the frequency range of a table
+UNUSABLE_COST = 1 << 20  # the cost of a symbol that a table has no code for
+
+
+def mtf_encode(text: str, alphabet: list[str]) -> list[int]:
+    """
+    Move-to-front: replace each character with its position in a list of recently used characters, and move it to the
+    front. Runs in the BWT text become runs of 0s, and frequent characters become small integers.
+
+    :time complexity: O(n*sigma) where sigma = len(alphabet)
+    :param text: the text to encode
+    :param alphabet: the initial list of characters (must contain every character of text)
+    :return: the position of each character
+    """
+    order = list(alphabet)
+    indices = [0] * len(text)
+    for i, char in enumerate(text):
+        k = order.index(char)
+        indices[i] = k
+        if k:
+            del order[k]
+            order.insert(0, char)
+
+    return indices
+
+
+def mtf_decode(indices: list[int], alphabet: list[str]) -> str:
+    """
+    Inverse of mtf_encode.
+    """
+    order = list(alphabet)
+    decoded = [None] * len(indices)
+    for i, k in enumerate(indices):
+        char = order[k]
+        decoded[i] = char
+        if k:
+            del order[k]
+            order.insert(0, char)
+
+    return "".join(decoded)
+
+
+def zero_run_encode(indices: list[int]) -> list[int]:
+    """
+    Replace each run of 0s with its length in bijective base 2 (RUNA = 1, RUNB = 2 times the weight of the digit)
+    and shift every other index up by one, the same as bzip2.
+
+    e.g. 0 0 0 0 3 -> RUNB RUNA 4
+    """
+    symbols = []
+    run = 0
+    for k in indices + [None]:  # None flushes the last run
+        if k == 0:
+            run += 1
+            continue
+
+        while run > 0:
+            if run & 1:
+                symbols.append(RUNA)
+                run = (run-1) >> 1
+            else:
+                symbols.append(RUNB)
+                run = (run-2) >> 1
+
+        if k is not None:
+            symbols.append(k+1)
+
+    return symbols
+
+
+def zero_run_decode(symbols: list[int]) -> list[int]:
+    """
+    Inverse of zero_run_encode.
+    """
+    indices = []
+    run, weight = 0, 1
+    for symbol in symbols + [None]:  # None flushes the last run
+        if symbol == RUNA or symbol == RUNB:
+            run += weight << symbol
+            weight <<= 1
+            continue
+
+        indices.extend([0]*run)
+        run, weight = 0, 1
+
+        if symbol is not None:
+            indices.append(symbol-1)
+
+    return indices
+
+
+def choose_n_tables(n_symbols: int) -> int:
+    """
+    The number of huffman tables for a block of n_symbols symbols (the same thresholds as bzip2): more tables only pay
+    off once there are enough groups to share them.
+    """
+    for n_tables, threshold in zip(range(MIN_TABLES, MAX_TABLES), (200, 600, 1200, 2400)):
+        if n_symbols < threshold:
+            return n_tables
+
+    return MAX_TABLES
+
+
+def initial_table_costs(freq: list[int], n_tables: int) -> list[list[int]]:
+    """
+    Split the symbols into n_tables consecutive ranges of roughly equal total frequency. A table starts out cheap for
+    the symbols in its range and expensive for the others, so that the first pass sends groups dominated by different
+    symbols to different tables.
+    """
+    costs = []
+    remaining = sum(freq)
+    lo = 0
+    for n_left in range(n_tables, 0, -1):
+        target = remaining / n_left
+        hi, accum = lo, 0
+        while hi < len(freq) and (accum < target or hi == lo):
+            accum += freq[hi]
+            hi += 1
+
+        cost = [EXPENSIVE_COST] * len(freq)
+        cost[lo:hi] = [CHEAP_COST] * (hi - lo)
+        costs.append(cost)
+
+        remaining -= accum
+        lo = hi
+
+    return costs
+
+
+def build_huffman_tables(symbols: list[int], alphabet_size: int) -> tuple[list[list[int]], list[int]]:
+    """
+    Build several huffman tables and pick one for each group of GROUP_SIZE symbols, so the code can follow the
+    statistics as they drift along the BWT text.
+
+    Each pass assigns every group to the table with the cheapest encoding of it, then rebuilds each table from the
+    frequencies of the groups assigned to it. Tables that end up with no group are dropped.
+
+    :time complexity: O(N_TABLE_ITERATIONS * g * t * d) where g is the number of groups, t the number of tables and
+                      d the number of distinct symbols in a group (at most GROUP_SIZE)
+    :param symbols: the symbols to encode
+    :param alphabet_size: the number of symbols
+    :return: the code lengths of each table, and the index of the table (selector) of each group
+    """
+    freq = [0] * alphabet_size
+    for symbol in symbols:
+        freq[symbol] += 1
+
+    # only the distinct symbols of a group and their counts are needed to cost it
+    groups = [list(Counter(symbols[g:g + GROUP_SIZE]).items()) for g in range(0, len(symbols), GROUP_SIZE)]
+
+    n_tables = choose_n_tables(len(symbols))
+    costs = initial_table_costs(freq, n_tables)
+    code_lengths: list[list[int]] = [[] for _ in range(n_tables)]
+    selectors: list[int] = []
+
+    for _ in range(N_TABLE_ITERATIONS):
+        table_freqs = [[0] * alphabet_size for _ in range(n_tables)]
+        selectors = []
+        for group in groups:
+            group_costs = [sum(cost[symbol] * count for symbol, count in group) for cost in costs]
+            best = group_costs.index(min(group_costs))
+            selectors.append(best)
+            for symbol, count in group:
+                table_freqs[best][symbol] += count
+
+        # an unused table keeps its costs; it is dropped below if it is still unused after the last pass
+        for t in range(n_tables):
+            if any(table_freqs[t]):
+                code_lengths[t] = huffman_code_lengths(table_freqs[t])
+                costs[t] = [length if length else UNUSABLE_COST for length in code_lengths[t]]
+            else:
+                code_lengths[t] = []
+
+    used_tables = sorted(set(selectors))
+    renumber = {t: i for i, t in enumerate(used_tables)}
+    return [code_lengths[t] for t in used_tables], [renumber[t] for t in selectors]
+
+
+def write_selectors(bits: BitWriter, selectors: list[int], n_tables: int) -> None:
+    """
+    selectors format (same as bzip2):
+    for each selector, its move-to-front position among the tables in unary (that many 1s followed by a 0)
+    Neighbouring groups tend to use the same table, so most selectors take a single bit.
+    """
+    order = list(range(n_tables))
+    for selector in selectors:
+        k = order.index(selector)
+        bits.write_bits((1 << (k+1)) - 2, k+1)
+        if k:
+            order.insert(0, order.pop(k))
+
+
+def read_selectors(bits: BitReader, n_selectors: int, n_tables: int) -> list[int]:
+    """
+    Read the selectors written by write_selectors.
+    """
+    indices = []
+    for _ in range(n_selectors):
+        k = 0
+        while bits.read_bit():
+            k += 1
+            if k >= n_tables:
+                raise ValueError("invalid selector")
+        indices.append(k)
+
+    order = list(range(n_tables))
+    selectors = [0] * n_selectors
+    for i, k in enumerate(indices):
+        selectors[i] = order[k]
+        if k:
+            order.insert(0, order.pop(k))
+
+    return selectors
+
+
+def mtf_encoder(text: str, bits: BitWriter) -> None:
+    """
+    Applies move-to-front and zero run encoding to given text and encodes the resulting symbols with Huffman.
+
+    output format (written to bits):
+    characters in use (bitmap, see huffman.write_symbols_in_use), which is also the initial move-to-front list,
+    number of tables (elias),
+    number of selectors (elias),
+    selectors (see write_selectors),
+    tables (for each table: symbols in use, delta coded code lengths of the canonical huffman codes over RUNA, RUNB and
+    1..sigma-1),
+    main_text (huffman codeword of each symbol, using the table selected for its group of GROUP_SIZE symbols)
+
+    :time complexity: O(n*sigma) for move-to-front where n = len(text)
+    :param text: an encoded text using BWT
+    :param bits: bit writer to write the encoded text into
+    """
+    in_use = [False] * (MAX_ASCII - MIN_ASCII + 2)
+    for char in set(text):
+        in_use[hash_char(char)] = True
+    write_symbols_in_use(bits, in_use)
+
+    alphabet = [hash_back_tochar(i) for i in range(len(in_use)) if in_use[i]]
+    with profile_stage("mtf", bytes_in=len(text)) as stage:
+        symbols = zero_run_encode(mtf_encode(text, alphabet))
+        stage.bytes_out = len(symbols)
+
+    # RUNA, RUNB and the indices 1..sigma-1 shifted by one
+    with profile_stage("huffman_tables", bytes_in=len(symbols)) as stage:
+        n_bits_before = len(bits)
+        tables, selectors = build_huffman_tables(symbols, len(alphabet)+1)
+
+        elias_encode(len(tables), bits)
+        elias_encode(len(selectors), bits)
+        write_selectors(bits, selectors, len(tables))
+        for code_lengths in tables:
+            write_code_lengths(bits, code_lengths)
+        stage.bytes_out = (len(bits) - n_bits_before) // 8
+
+    with profile_stage("bit_packing", bytes_in=len(symbols)) as stage:
+        n_bits_before = len(bits)
+        code_tables = [assign_canonical_codes(code_lengths) for code_lengths in tables]
+        for g, selector in enumerate(selectors):
+            code_table = code_tables[selector]
+            for symbol in symbols[g * GROUP_SIZE:(g+1) * GROUP_SIZE]:
+                code_word = code_table[symbol]
+                bits.write_bits(code_word.to_decimal(), len(code_word))
+        stage.bytes_out = (len(bits) - n_bits_before) // 8
+
+
+def mtf_decoder(encoded_text: BitReader, bwt_length: int) -> str:
+    """
+    Decode the symbols written by mtf_encoder and undo zero run and move-to-front encoding.
+    There is no end of block symbol; decoding stops as soon as bwt_length characters are covered.
+
+    :param encoded_text: a bit reader positioned at the start of the characters in use
+    :param bwt_length: the length of the original bwt string
+    :return: the decoded string
+    """
+    with profile_stage("huffman_decode") as stage:
+        n_bits_left = len(encoded_text)
+        alphabet = [hash_back_tochar(i) for i in read_symbols_in_use(encoded_text, MAX_ASCII - MIN_ASCII + 2)]
+        n_tables = elias_decode(encoded_text)
+        n_selectors = elias_decode(encoded_text)
+        if n_tables > MAX_TABLES:
+            raise ValueError("too many huffman tables")
+        selectors = read_selectors(encoded_text, n_selectors, n_tables)
+        tables = [build_decode_table(read_code_lengths(encoded_text, len(alphabet)+1)) for _ in range(n_tables)]
+
+        # a pending run can only grow with more digits, so stop once it (with what was decoded) covers the whole text
+        symbols = []
+        n_decoded, run, weight = 0, 0, 1
+        while n_decoded + run < bwt_length:
+            # switch tables at the start of every group
+            if len(symbols) % GROUP_SIZE == 0:
+                if len(symbols) // GROUP_SIZE >= n_selectors:
+                    raise ValueError("not enough selectors")
+                table = tables[selectors[len(symbols) // GROUP_SIZE]]
+
+            symbol = decode_symbol(table, encoded_text)
+            symbols.append(symbol)
+
+            if symbol == RUNA or symbol == RUNB:
+                run += weight << symbol
+                weight <<= 1
+            else:
+                n_decoded += run + 1
+                run, weight = 0, 1
+
+        if n_decoded + run != bwt_length:
+            raise ValueError("decoded text is longer than the bwt length")
+        stage.bytes_in = (n_bits_left - len(encoded_text)) // 8
+        stage.bytes_out = len(symbols)
+
+    with profile_stage("mtf_decode", bytes_in=len(symbols)) as stage:
+        indices = zero_run_decode(symbols)
+        if max(indices) >= len(alphabet):
+            raise ValueError("invalid move-to-front index")
+
+        decoded_text = mtf_decode(indices, alphabet)
+        stage.bytes_out = len(decoded_text)
+
+    return decoded_text
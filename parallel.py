@@ -0,0 +1,55 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "Helpers to process independent blocks in a pool of worker processes"
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def resolve_jobs(jobs: Optional[int]) -> int:
+    """
+    Convert the requested number of jobs into an actual number of worker processes.
+    None or 0 means "use every core".
+    """
+    if jobs is None or jobs == 0:
+        return os.cpu_count() or 1
+
+    if jobs < 0:
+        raise ValueError("jobs must be a positive integer (or 0 to use every core)")
+
+    return jobs
+
+
+def ordered_parallel_map(function: Callable[[T], R], items: Iterable[T], jobs: Optional[int] = 1) -> Iterator[R]:
+    """
+    Apply function to each item in a pool of worker processes, yielding results in the order of the items.
+
+    Unlike Executor.map, items are submitted lazily: at most 2 * jobs items are in flight at any time, so memory stays
+    bounded by a few blocks even when items comes from a generator over a huge input.
+    With a single job, items are processed in this process without starting a pool.
+
+    :param function: a picklable (module level) function
+    :param items: the items to process
+    :param jobs: the number of worker processes (None or 0 for every core)
+    :return: an iterator over the results, in order
+    """
+    jobs = resolve_jobs(jobs)
+    if jobs == 1:
+        yield from map(function, items)
+        return
+
+    max_in_flight = 2 * jobs
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,193 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "Opt-in per-stage instrumentation of the encoder and decoder"
+
+import json
+import time
+import tracemalloc
+from typing import Callable, Optional, Union
+
+
+class StageStats:
+    """
+    The totals of every call of one stage.
+    """
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.wall_seconds: float = 0.0
+        self.cpu_seconds: float = 0.0
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        self.peak_memory_bytes: int = 0  # the largest peak of a single call, above the memory in use when it started
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "peak_memory_bytes": self.peak_memory_bytes,
+        }
+
+
+class StageCall:
+    """
+    One call of a stage, measured between __enter__ and __exit__. The instrumented code sets bytes_out (and bytes_in
+    if it was not known up front) before leaving the with block.
+    """
+    def __init__(self, profiler: "Profiler", name: str, bytes_in: int) -> None:
+        self.profiler: Profiler = profiler
+        self.name: str = name
+        self.bytes_in: int = bytes_in
+        self.bytes_out: int = 0
+
+        self.wall_seconds: float = 0.0
+        self.cpu_seconds: float = 0.0
+        self.peak_memory_bytes: int = 0
+        self.start_wall: float = 0.0
+        self.start_cpu: float = 0.0
+
+        # the memory in use when the call started, and the highest peak seen so far (including nested calls)
+        self.start_memory: int = 0
+        self.peak_seen: int = 0
+
+    def __enter__(self) -> "StageCall":
+        self.profiler.enter(self)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.wall_seconds = time.perf_counter() - self.start_wall
+        self.cpu_seconds = time.process_time() - self.start_cpu
+        self.profiler.exit(self)
+
+
+class NullStageCall:
+    """
+    Stands in for StageCall while no profiler is active, so that instrumented code costs one attribute lookup.
+    """
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    def __enter__(self) -> "NullStageCall":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def __setattr__(self, name: str, value) -> None:
+        pass  # the instrumented code may set bytes_in/bytes_out; there is nothing to record them in
+
+
+NULL_STAGE_CALL = NullStageCall()
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time, number of calls, bytes in/out and (optionally) peak tracemalloc memory of each
+    stage of the encoder and decoder while it is active:
+
+        with Profiler(trace_memory=True) as profiler:
+            encoder(text)
+        print(profiler.to_json())
+
+    Each callback is called with the stage name and the StageCall after every call of a stage, e.g. to stream the
+    measurements somewhere else.
+    Stages run in worker processes (jobs > 1) are not recorded; profile with jobs = 1 to see every stage.
+    Nested stages are included in the time and memory of the stages around them.
+    """
+    def __init__(self, trace_memory: bool = False,
+                 callbacks: Optional[list[Callable[[str, StageCall], None]]] = None) -> None:
+        self.trace_memory: bool = trace_memory
+        self.callbacks: list[Callable[[str, StageCall], None]] = list(callbacks or [])
+        self.stages: dict[str, StageStats] = {}
+
+        self.active_calls: list[StageCall] = []
+        self.started_tracemalloc: bool = False
+        self.previous_profiler: Optional[Profiler] = None
+
+    def add_callback(self, callback: Callable[[str, StageCall], None]) -> None:
+        self.callbacks.append(callback)
+
+    def __enter__(self) -> "Profiler":
+        global _active_profiler
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+
+        self.previous_profiler = _active_profiler
+        _active_profiler = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active_profiler
+
+        _active_profiler = self.previous_profiler
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def enter(self, call: StageCall) -> None:
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.active_calls:
+                parent = self.active_calls[-1]
+                parent.peak_seen = max(parent.peak_seen, peak)
+
+            # the peak is global, so it is reset for the new call and the parent keeps what it saw before
+            tracemalloc.reset_peak()
+            call.start_memory = call.peak_seen = current
+
+        self.active_calls.append(call)
+
+    def exit(self, call: StageCall) -> None:
+        self.active_calls.pop()
+
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            call.peak_seen = max(call.peak_seen, peak)
+            call.peak_memory_bytes = call.peak_seen - call.start_memory
+            if self.active_calls:
+                parent = self.active_calls[-1]
+                parent.peak_seen = max(parent.peak_seen, call.peak_seen)
+
+        stats = self.stages.setdefault(call.name, StageStats())
+        stats.calls += 1
+        stats.wall_seconds += call.wall_seconds
+        stats.cpu_seconds += call.cpu_seconds
+        stats.bytes_in += call.bytes_in
+        stats.bytes_out += call.bytes_out
+        stats.peak_memory_bytes = max(stats.peak_memory_bytes, call.peak_memory_bytes)
+
+        for callback in self.callbacks:
+            callback(call.name, call)
+
+    def to_dict(self) -> dict:
+        return {"stages": {name: stats.to_dict() for name, stats in self.stages.items()}}
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+
+_active_profiler: Optional[Profiler] = None
+
+
+def profile_stage(name: str, bytes_in: int = 0) -> Union[StageCall, NullStageCall]:
+    """
+    Measure the code in a with block as one call of a stage, if a profiler is active:
+
+        with profile_stage("bwt_gather", bytes_in=len(text)) as stage:
+            ...
+            stage.bytes_out = len(bwt_text)
+
+    :param name: the name of the stage
+    :param bytes_in: the size of the input of the stage
+    :return: a context manager giving the StageCall (or a stand-in that records nothing)
+    """
+    if _active_profiler is None:
+        return NULL_STAGE_CALL
+
+    return StageCall(_active_profiler, name, bytes_in)
@@ -10,8 +10,11 @@ from typing import Optional
 import heapq as hq
 
 from elias import elias_encode
-from utilities import MIN_ASCII, MAX_ASCII, hash_char, hash_back_tochar
+from huffman import MAX_CODE_LENGTH, assign_canonical_codes, length_limited_code_lengths, write_code_lengths
+from utilities import MIN_ASCII, MAX_ASCII, hash_char
 from original_bitarray import BitArray
+from bitstream import BitWriter
+from profiling import profile_stage
 
 
 class HeapElement:
@@ -30,60 +33,45 @@ class HeapElement:
         return str((self.freq, self.num_chars, self.chars_asciis))
 
 
-def runlength_encoder(text: str) -> tuple[BitArray, BitArray, BitArray]:
+def huffman_code_lengths(freq: list[int], max_length: int = MAX_CODE_LENGTH) -> list[int]:
     """
-    Applies runlength encoding to given text. Uses Elias to encode length and Huffman to encode characters.
-
-    :time complexity: O(nlogn) for huffman to store subtrees into the heap; (Elias is linear time) where n = len(text)
-    :aux space complexity: O(n+m) where m represents the total encoded bitarray length
-
-    :param text: an encoded text using BWT
-    :return: bitarray representing the encoded text
+    Compute the Huffman code length of each symbol by repeatedly merging the two least frequent subtrees.
+    Every merge adds one bit to the codes of all symbols in both subtrees.
+    On skewed distributions this can produce codes longer than max_length; the lengths are then recomputed with the
+    length-limited package-merge instead.
+
+    :time complexity: O(s^2) where s is the number of unique symbols (merging their lists); O(s log s) for the heap
+    :param freq: the frequency of each symbol
+    :param max_length: the maximum code length
+    :return: the code length of each symbol (0 if the symbol does not appear)
     """
+    code_lengths = [0] * len(freq)
 
-
-    # MAIN PART
-    # create frequency table
-    freq = [0] * (MAX_ASCII - MIN_ASCII + 2)
-    for char in text:
-        freq[hash_char(char)] += 1
-
-    num_unique_chars = 0
     heap_elements = []
     for i in range(len(freq)):
         if freq[i]:
             heap_element = HeapElement(freq[i], 1, [i])
             heap_elements.append(heap_element)
-            num_unique_chars += 1
-
-    encoded_num_unique_chars = elias_encode(num_unique_chars)
 
-    # store the encoded bits at corresponding index
-    code_table: list[Optional[BitArray]] = [None] * (MAX_ASCII - MIN_ASCII + 2)
+    # a single symbol still needs a 1 bit code
+    if len(heap_elements) == 1:
+        code_lengths[heap_elements[0].chars_asciis[0]] = 1
+        return code_lengths
 
     # heapify
     hq.heapify(heap_elements)
 
-    # creating the code_table using heap
-    while True:
+    # computing the code lengths using heap
+    while len(heap_elements) > 1:
         left: HeapElement = hq.heappop(heap_elements)
         right: HeapElement = hq.heappop(heap_elements)
 
         # "prepend" a bit to corresponding chars
         for char_idx in left.chars_asciis:
-            if code_table[char_idx] is None:
-                code_table[char_idx] = BitArray()
-
-            code_table[char_idx].append(0)
+            code_lengths[char_idx] += 1
 
         for char_idx in right.chars_asciis:
-            if code_table[char_idx] is None:
-                code_table[char_idx] = BitArray()
-
-            code_table[char_idx].append(1)
-
-        if len(heap_elements) == 0:
-            break
+            code_lengths[char_idx] += 1
 
         assert left.chars_asciis is not None and right.chars_asciis is not None, "should not be none"
 
@@ -95,55 +83,68 @@ def runlength_encoder(text: str) -> tuple[BitArray, BitArray, BitArray]:
         # insert the concatenated node
         hq.heappush(heap_elements, left)
 
-    # reverse the bits
-    for ascii_bits in code_table:
-        if ascii_bits is not None:
-            ascii_bits.reverse()
+    if max(code_lengths) > max_length:
+        return length_limited_code_lengths(freq, max_length)
 
-    # traverse through the text to do run length encoding
-    # for each consecutive same chars, combine them all together e.g. aaaa -> 4a
-    # apply elias and huffman
-    encoded_text = BitArray()
-    accum = 1
-    prev_char = text[0]
-    for i in range(1, len(text)):
-        char = text[i]
-        if char == prev_char:
-            accum += 1
-        else:
-            run_length = elias_encode(accum)
-            encoded_text.extend(run_length)
-            encoded_text.extend(code_table[hash_char(prev_char)])
+    return code_lengths
 
-            accum = 1
-            prev_char = char
 
-    # for the remaining char (can be 1 or many)
-    run_length = elias_encode(accum)
-    encoded_text.extend(run_length)
-    encoded_text.extend(code_table[hash_char(prev_char)])
-
-    # encode table
-    encoded_code_table = BitArray()
-    for char_idx, code_word in enumerate(code_table):
-        if code_word is not None:
-            char_ascii = create_fixed_length_ascii_bitarray(hash_back_tochar(char_idx))  # the ascii must be in 7 bits
-            char_length = elias_encode(len(code_word))
-
-            encoded_code_table.extend(char_ascii)
-            encoded_code_table.extend(char_length)
-            encoded_code_table.extend(code_word)
-
-    return encoded_num_unique_chars, encoded_text, encoded_code_table
-
-
-def create_fixed_length_ascii_bitarray(char: str):
-    assert len(char) == 1, "length of the string must be 1"
-
-    ascii_value = ord(char)  # get the ASCII value of the character
-    return BitArray(ascii_value, 7)
+def runlength_encoder(text: str, bits: BitWriter) -> None:
+    """
+    Applies runlength encoding to given text. Uses Elias to encode length and Huffman to encode characters.
+    The Huffman codes are canonical, so the table only stores code lengths (see huffman.write_code_lengths).
 
+    output format (written to bits):
+    table (symbols in use, delta coded code lengths),
+    main_text (elias length, huffman codeword)
 
+    :time complexity: O(nlogn) for huffman to store subtrees into the heap; (Elias is linear time) where n = len(text)
+    :aux space complexity: O(n+m) where m represents the total encoded bitarray length
 
+    :param text: an encoded text using BWT
+    :param bits: bit writer to write the encoded text into
+    """
 
 
+    # MAIN PART
+    with profile_stage("huffman_tables", bytes_in=len(text)) as stage:
+        n_bits_before = len(bits)
+
+        # create frequency table
+        freq = [0] * (MAX_ASCII - MIN_ASCII + 2)
+        for char in text:
+            freq[hash_char(char)] += 1
+
+        # code lengths and canonical codes at the index of the corresponding (hashed) character
+        code_lengths = huffman_code_lengths(freq)
+        code_table: list[Optional[BitArray]] = assign_canonical_codes(code_lengths)
+
+        # encode the table
+        write_code_lengths(bits, code_lengths)
+        stage.bytes_out = (len(bits) - n_bits_before) // 8
+
+    with profile_stage("bit_packing", bytes_in=len(text)) as stage:
+        n_bits_before = len(bits)
+
+        # traverse through the text to do run length encoding
+        # for each consecutive same chars, combine them all together e.g. aaaa -> 4a
+        # apply elias and huffman
+        accum = 1
+        prev_char = text[0]
+        for i in range(1, len(text)):
+            char = text[i]
+            if char == prev_char:
+                accum += 1
+            else:
+                elias_encode(accum, bits)
+                code_word = code_table[hash_char(prev_char)]
+                bits.write_bits(code_word.to_decimal(), len(code_word))
+
+                accum = 1
+                prev_char = char
+
+        # for the remaining char (can be 1 or many)
+        elias_encode(accum, bits)
+        code_word = code_table[hash_char(prev_char)]
+        bits.write_bits(code_word.to_decimal(), len(code_word))
+        stage.bytes_out = (len(bits) - n_bits_before) // 8
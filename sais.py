@@ -0,0 +1,193 @@
+__author__ = "Satoshi Kashima"
+__sid__ = 32678940
+__description__ = "The implementation of SA-IS (suffix array construction by induced sorting)"
+
+from array import array
+
+from utilities import MIN_ASCII, MAX_ASCII, SENTINEL, hash_char
+from profiling import profile_stage
+
+S_TYPE, L_TYPE = 1, 0
+
+
+def classify_suffixes(s: array) -> bytearray:
+    """
+    Classify each suffix as S-type (smaller than the next suffix) or L-type (larger than the next suffix).
+    The last suffix (the sentinel) is S-type by definition.
+
+    :time complexity: O(n)
+    :aux space complexity: O(n) bytes
+    """
+    n = len(s)
+    types = bytearray(n)
+    types[n - 1] = S_TYPE
+    for i in range(n - 2, -1, -1):
+        if s[i] < s[i + 1] or (s[i] == s[i + 1] and types[i + 1] == S_TYPE):
+            types[i] = S_TYPE
+
+    return types
+
+
+def is_lms(types: bytearray, i: int) -> bool:
+    """
+    A leftmost S-type (LMS) position is an S-type position right after an L-type one.
+    """
+    return i > 0 and types[i] == S_TYPE and types[i - 1] == L_TYPE
+
+
+def get_bucket_sizes(s: array, alphabet_size: int) -> list[int]:
+    bucket_sizes = [0] * alphabet_size
+    for char in s:
+        bucket_sizes[char] += 1
+
+    return bucket_sizes
+
+
+def get_bucket_heads(bucket_sizes: list[int]) -> list[int]:
+    heads = [0] * len(bucket_sizes)
+    acum = 0
+    for char, size in enumerate(bucket_sizes):
+        heads[char] = acum
+        acum += size
+
+    return heads
+
+
+def get_bucket_tails(bucket_sizes: list[int]) -> list[int]:
+    tails = [0] * len(bucket_sizes)
+    acum = 0
+    for char, size in enumerate(bucket_sizes):
+        acum += size
+        tails[char] = acum  # exclusive
+
+    return tails
+
+
+def induce_sort(s: array, types: bytearray, sa: array, bucket_sizes: list[int]) -> None:
+    """
+    Given LMS positions placed at the ends of their buckets, induce the order of L-type suffixes (left to right)
+    and then of S-type suffixes (right to left).
+
+    :time complexity: O(n)
+    """
+    n = len(s)
+
+    heads = get_bucket_heads(bucket_sizes)
+    for i in range(n):
+        j = sa[i] - 1
+        if j >= 0 and types[j] == L_TYPE:
+            char = s[j]
+            sa[heads[char]] = j
+            heads[char] += 1
+
+    tails = get_bucket_tails(bucket_sizes)
+    for i in range(n - 1, -1, -1):
+        j = sa[i] - 1
+        if j >= 0 and types[j] == S_TYPE:
+            char = s[j]
+            tails[char] -= 1
+            sa[tails[char]] = j
+
+
+def lms_substrings_equal(s: array, types: bytearray, first: int, second: int) -> bool:
+    """
+    Compare the LMS substrings (from an LMS position up to and including the next one) starting at first and second.
+    """
+    n = len(s)
+    if first == n - 1 or second == n - 1:
+        return False  # the sentinel substring is unique
+
+    k = 0
+    while True:
+        first_is_lms = is_lms(types, first + k)
+        second_is_lms = is_lms(types, second + k)
+        if k > 0 and first_is_lms and second_is_lms:
+            return True
+        if first_is_lms != second_is_lms or s[first + k] != s[second + k] or types[first + k] != types[second + k]:
+            return False
+        k += 1
+
+
+def sais(s: array, alphabet_size: int) -> array:
+    """
+    The implementation of SA-IS.
+
+    :time complexity: O(n) where n = len(s)
+    :aux space complexity: O(n) integers (stored in arrays, not python objects)
+    :param s: an integer array whose last element is a unique sentinel, smaller than any other element
+    :param alphabet_size: every element of s must be in range(alphabet_size)
+    :return: the suffix array of s (0-based)
+    """
+    n = len(s)
+    sa = array("i", [-1]) * n
+    if n == 1:
+        sa[0] = 0
+        return sa
+
+    types = classify_suffixes(s)
+    bucket_sizes = get_bucket_sizes(s, alphabet_size)
+
+    # step 1: sort the LMS substrings by placing LMS positions at the ends of their buckets and inducing
+    tails = get_bucket_tails(bucket_sizes)
+    for i in range(1, n):
+        if is_lms(types, i):
+            char = s[i]
+            tails[char] -= 1
+            sa[tails[char]] = i
+    induce_sort(s, types, sa, bucket_sizes)
+
+    # step 2: name the sorted LMS substrings; equal substrings get the same name
+    sorted_lms = array("i", [i for i in sa if is_lms(types, i)])
+    names = array("i", [-1]) * n
+    name = 0
+    names[sorted_lms[0]] = name
+    for k in range(1, len(sorted_lms)):
+        if not lms_substrings_equal(s, types, sorted_lms[k - 1], sorted_lms[k]):
+            name += 1
+        names[sorted_lms[k]] = name
+
+    lms_positions = array("i", [i for i in range(1, n) if is_lms(types, i)])
+    reduced_s = array("i", [names[i] for i in lms_positions])
+    del names
+
+    # step 3: sort the LMS suffixes, recursing only when some LMS substrings share a name
+    if name + 1 < len(reduced_s):
+        reduced_sa = sais(reduced_s, name + 1)
+        sorted_lms = array("i", [lms_positions[i] for i in reduced_sa])
+    del reduced_s, lms_positions
+
+    # step 4: place the sorted LMS suffixes at the ends of their buckets (in order) and induce the rest
+    for i in range(n):
+        sa[i] = -1
+    tails = get_bucket_tails(bucket_sizes)
+    for k in range(len(sorted_lms) - 1, -1, -1):
+        i = sorted_lms[k]
+        char = s[i]
+        tails[char] -= 1
+        sa[tails[char]] = i
+    induce_sort(s, types, sa, bucket_sizes)
+
+    return sa
+
+
+def suffix_array(text: str) -> array:
+    """
+    1) appends "$" symbol and maps every character to an integer (with "$" as the smallest)
+    2) invokes SA-IS
+    3) converts the result to 1-based indexes, the same as st2sa.suffix_array
+
+    :time complexity: O(n) where n = len(text)
+    :aux space complexity: O(n) integers, a few bytes per character
+    :param text: the text to create a suffix array for
+    :return: the suffix array in 1-based indexing
+    """
+    with profile_stage("suffix_array", bytes_in=len(text)) as stage:
+        s = array("i", (hash_char(char) for char in text))
+        s.append(hash_char(SENTINEL))
+
+        sa = sais(s, MAX_ASCII - MIN_ASCII + 2)
+        for i in range(len(sa)):
+            sa[i] += 1  # 1-based indexing
+        stage.bytes_out = len(sa) * sa.itemsize
+
+    return sa
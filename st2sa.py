@@ -2,38 +2,93 @@ __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 
 import sys
+from array import array
+from typing import Iterator
 
-from ukkonen import ukkonen, Node
+from ukkonen import ukkonen, ukkonen_compact, CompactSuffixTree, Node
+from utilities import SENTINEL
+from profiling import profile_stage
 
 
-def inorder_traversal(current: Node) -> list[int]:
+def inorder_traversal(current: Node) -> Iterator[int]:
     """
-    Traverses through the given node inorder
+    Traverses through the given node inorder, yielding the (1-based) suffix index of each leaf.
+    Iterative with an explicit stack, so deep trees (e.g. long runs of the same character) do not hit the recursion limit.
+
+    :time complexity: O(number of nodes * alphabet size) to scan the edges of each internal node
+    :aux space complexity: O(n) for the stack
     """
-    result = []
+    stack = [current]
+    while stack:
+        current = stack.pop()
 
-    if current.is_leaf:
-        result.append(current.suffix_starting_idx+1)
-        return result  # +1 for 1-base indexing
+        if current.is_leaf:
+            yield current.suffix_starting_idx+1  # +1 for 1-base indexing
+            continue
 
-    for node in current.edges:
-        if node is not None:
-            result.extend(inorder_traversal(node))
+        # push in reverse so that the smallest edge is popped first
+        for node in reversed(current.edges):
+            if node is not None:
+                stack.append(node)
 
-    return result
 
-def suffix_array(text: str) -> list[int]:
+def compact_inorder_traversal(tree: CompactSuffixTree, current: int) -> Iterator[int]:
+    """
+    Traverses through the given node of a compact suffix tree inorder, yielding the (1-based) suffix index of each leaf.
+    Iterative with an explicit stack, same as inorder_traversal.
+    """
+    stack = [current]
+    while stack:
+        current = stack.pop()
+
+        if tree.is_leaf(current):
+            yield tree.leaf_index[current]+1  # +1 for 1-base indexing
+            continue
+
+        children = list(tree.get_children(current))
+        children.reverse()
+        stack.extend(children)
+
+
+def iter_suffix_array(text: str) -> Iterator[int]:
     """
     1) appends "$" symbol
     2) invokes Ukkonen
-    3) apply inorder traversal to the created tree to obtain indexes corresponding to the suffix array
+    3) apply inorder traversal to the created tree to yield indexes corresponding to the suffix array, one by one
+    """
+    text += SENTINEL  # O(n)
+    with profile_stage("suffix_tree", bytes_in=len(text)):
+        root = ukkonen(text)
+    yield from inorder_traversal(root)
+
+
+def iter_suffix_array_compact(text: str) -> Iterator[int]:
     """
-    result = [None]*(len(text)+1)
-    text += "$"  # O(n)
-    root = ukkonen(text)
-    suffix_array_idxs = inorder_traversal(root)
+    Same as iter_suffix_array, but builds the suffix tree with the array-backed ukkonen_compact
+    """
+    text += SENTINEL  # O(n)
+    with profile_stage("suffix_tree", bytes_in=len(text)):
+        tree = ukkonen_compact(text)
+    yield from compact_inorder_traversal(tree, CompactSuffixTree.ROOT)
+
+
+def fill_suffix_array(text: str, suffix_array_idxs: Iterator[int]) -> array:
+    """
+    Store the streamed indexes into a preallocated array (4 bytes per index) instead of a list.
+    """
+    result = array("i", [0])*(len(text)+1)
+    for i, suffix_idx in enumerate(suffix_array_idxs):
+        result[i] = suffix_idx
+
+    return result
+
+
+def suffix_array(text: str) -> array:
+    return fill_suffix_array(text, iter_suffix_array(text))
+
 
-    return suffix_array_idxs
+def suffix_array_compact(text: str) -> array:
+    return fill_suffix_array(text, iter_suffix_array_compact(text))
 
 
 def format_output(result):
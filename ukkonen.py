@@ -4,13 +4,12 @@ __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 __description__ = "The implementation of Ukkonen Suffix Link"
 
-from typing import Optional, Union
+from typing import Iterator, Optional, Union
 from abc import ABC
-from utilities import hash_char
+from array import array
+from utilities import MIN_ASCII, MAX_ASCII, hash_char
 
 
-MIN_ASCII, MAX_ASCII = 37, 126
-
 class ActivePointer(ABC):
     """
     A pointer that points to a particular node in the tree.
@@ -717,3 +716,194 @@ def showstopper_extension(i: int, j: int, pointer: ShowstopperActivePointer,
 
 
     raise ValueError("shouldn't come here")
+
+
+NO_NODE = -1  # used for missing children, siblings and leaf indexes
+LEAF_END = -1  # the end of every leaf is the global end
+
+
+class CompactSuffixTree:
+    """
+    A suffix tree whose nodes are integer ids into parallel array columns, instead of Node objects.
+
+    Each node uses 6 ints (24 bytes): start and end of its incoming edge, suffix link, leaf index (the starting index
+    of its suffix), first child and next sibling. Children are stored sparsely as a linked list sorted by the first
+    character of their edge, so no node carries a table for the whole alphabet.
+    Node 0 is the root.
+    """
+
+    ROOT = 0
+
+    def __init__(self, codes: array) -> None:
+        self.codes: array = codes  # the hashed text, see utilities.hash_char
+        self.start: array = array("i")
+        self.end: array = array("i")
+        self.suffix_link: array = array("i")
+        self.leaf_index: array = array("i")
+        self.first_child: array = array("i")
+        self.next_sibling: array = array("i")
+
+        self.add_node(0, -1)  # the root
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def add_node(self, start: int, end: int, leaf_index: int = NO_NODE) -> int:
+        """
+        Create a node without any connection and return its id.
+        """
+        self.start.append(start)
+        self.end.append(end)
+        self.suffix_link.append(self.ROOT)
+        self.leaf_index.append(leaf_index)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        return len(self.start) - 1
+
+    def is_leaf(self, node: int) -> bool:
+        return self.leaf_index[node] != NO_NODE
+
+    def get_end(self, node: int) -> int:
+        end = self.end[node]
+        return len(self.codes) - 1 if end == LEAF_END else end
+
+    def get_child(self, node: int, code: int) -> int:
+        """
+        Find the child whose edge starts with the given hashed character.
+
+        :time complexity: O(number of children)
+        """
+        codes, start, next_sibling = self.codes, self.start, self.next_sibling
+        child = self.first_child[node]
+        while child != NO_NODE:
+            child_code = codes[start[child]]
+            if child_code == code:
+                return child
+            if child_code > code:
+                return NO_NODE
+            child = next_sibling[child]
+
+        return NO_NODE
+
+    def add_child(self, node: int, child: int) -> None:
+        """
+        Insert a child, keeping the children sorted by the first character of their edge.
+        """
+        codes, start, next_sibling = self.codes, self.start, self.next_sibling
+        code = codes[start[child]]
+
+        previous = NO_NODE
+        current = self.first_child[node]
+        while current != NO_NODE and codes[start[current]] < code:
+            previous = current
+            current = next_sibling[current]
+
+        next_sibling[child] = current
+        if previous == NO_NODE:
+            self.first_child[node] = child
+        else:
+            next_sibling[previous] = child
+
+    def replace_child(self, node: int, old_child: int, new_child: int) -> None:
+        """
+        Put new_child where old_child was (both edges start with the same character).
+        """
+        next_sibling = self.next_sibling
+        next_sibling[new_child] = next_sibling[old_child]
+        next_sibling[old_child] = NO_NODE
+
+        if self.first_child[node] == old_child:
+            self.first_child[node] = new_child
+            return
+
+        current = self.first_child[node]
+        while next_sibling[current] != old_child:
+            current = next_sibling[current]
+        next_sibling[current] = new_child
+
+    def get_children(self, node: int) -> Iterator[int]:
+        """
+        Iterate over the children of a node, in the order of the first character of their edges.
+        """
+        child = self.first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+
+def ukkonen_compact(text: str) -> CompactSuffixTree:
+    """
+    The implementation of Ukkonen suffix tree construction algorithm on top of CompactSuffixTree.
+    Uses the same tricks as ukkonen (suffix links, skip count, rapid leaf extension with a global end and showstopper),
+    kept as an active point (active node, active edge, active length) and the number of remaining suffixes.
+
+    :time complexity: O(n * sigma) where n = len(text); sigma bounds the children scanned to find an edge
+    :space complexity: O(n) for storing nodes, 24 bytes per node
+
+    :param text: a string representing the text being processed, ending with a unique "$"
+    :return: the suffix tree
+    """
+    codes = array("i", (hash_char(char) for char in text))
+    tree = CompactSuffixTree(codes)
+    root = CompactSuffixTree.ROOT
+    start, end, suffix_link = tree.start, tree.end, tree.suffix_link
+
+    active_node, active_edge, active_length = root, 0, 0
+    remainder = 0  # the number of suffixes yet to be inserted explicitly
+
+    for i in range(len(codes)):
+        remainder += 1
+        previous_branched_node = NO_NODE  # for linking nodes
+
+        while remainder > 0:
+            if active_length == 0:
+                active_edge = i
+
+            current_node = tree.get_child(active_node, codes[active_edge])
+
+            # case 2-alt: branch at the active node
+            if current_node == NO_NODE:
+                tree.add_child(active_node, tree.add_node(i, LEAF_END, i - remainder + 1))
+                if previous_branched_node != NO_NODE:
+                    suffix_link[previous_branched_node] = active_node
+                    previous_branched_node = NO_NODE
+
+            else:
+                # skip count: walk down to the next node if the active length covers the whole edge
+                edge_end = i if end[current_node] == LEAF_END else end[current_node]
+                edge_length = edge_end - start[current_node] + 1
+                if active_length >= edge_length:
+                    active_edge += edge_length
+                    active_length -= edge_length
+                    active_node = current_node
+                    continue
+
+                # case 3 - the one already exists: showstopper
+                if codes[start[current_node] + active_length] == codes[i]:
+                    if previous_branched_node != NO_NODE and active_node != root:
+                        suffix_link[previous_branched_node] = active_node
+                    active_length += 1
+                    break
+
+                # case 2 - branch out in the middle of the edge
+                internal_node = tree.add_node(start[current_node], start[current_node] + active_length - 1)
+                tree.replace_child(active_node, current_node, internal_node)
+                start[current_node] += active_length
+                tree.add_child(internal_node, current_node)
+                tree.add_child(internal_node, tree.add_node(i, LEAF_END, i - remainder + 1))
+
+                # resolve pending suffix links
+                if previous_branched_node != NO_NODE:
+                    suffix_link[previous_branched_node] = internal_node
+                previous_branched_node = internal_node
+
+            remainder -= 1
+
+            # move on to the next extension
+            if active_node == root and active_length > 0:
+                active_length -= 1
+                active_edge = i - remainder + 1
+            elif active_node != root:
+                active_node = suffix_link[active_node]
+
+    return tree
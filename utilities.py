@@ -2,29 +2,43 @@ __author__ = "Satoshi Kashima"
 __sid__ = 32678940
 
 
+import mmap
+import os
 import random
+import stat
+import sys
+from contextlib import contextmanager, nullcontext, suppress
+from typing import BinaryIO, ContextManager, Iterator
 
-MIN_ASCII, MAX_ASCII = 37, 126
+# texts are bytes decoded as latin-1, so every byte of a file is one character in this range
+MIN_ASCII, MAX_ASCII = 0, 255
+TEXT_ENCODING = "latin-1"
+
+# the unique end of text marker ("$" in the comments); it is outside the byte range so it never appears in a text,
+# and it hashes to 0 so it is smaller than every character
+SENTINEL = chr(MAX_ASCII + 1)
+
+STDIO_PATH = "-"  # the path that stands for stdin/stdout on the command line
 
 
 def hash_char(char: str) -> int:
-    assert MIN_ASCII <= ord(char) <= MAX_ASCII or char == "$", "all characters must be in ascii value of 37-126, or '$'"
+    assert MIN_ASCII <= ord(char) <= MAX_ASCII or char == SENTINEL, "all characters must be bytes (0-255), or '$'"
 
-    if char == "$":
+    if char == SENTINEL:
         return 0
     else:
         return ord(char) - MIN_ASCII + 1
 
 def hash_back_tochar(idx) -> str:
     if idx == 0:
-        return "$"
+        return SENTINEL
     else:
         return chr(idx + MIN_ASCII - 1)
 
 def hash_char_from_ascii(char_ascii: int):
-    assert MIN_ASCII <= char_ascii <= MAX_ASCII or char_ascii == ord("$"), "all characters must be in ascii value of 37-126, or '$'"
+    assert MIN_ASCII <= char_ascii <= MAX_ASCII or char_ascii == ord(SENTINEL), "all characters must be bytes (0-255), or '$'"
 
-    if char_ascii == ord("$"):
+    if char_ascii == ord(SENTINEL):
         return 0
     else:
         return char_ascii - MIN_ASCII + 1
@@ -33,3 +47,51 @@ def generate_random_string():
     length = random.randint(1, 50)
     ascii_range = (MIN_ASCII, MAX_ASCII)
     return ''.join(chr(random.randint(*ascii_range)) for _ in range(length))
+
+
+def open_input(path: str) -> ContextManager[BinaryIO]:
+    """
+    Open a file for reading in binary mode, or stdin if path is "-" (which is left open afterwards).
+    """
+    if path == STDIO_PATH:
+        return nullcontext(sys.stdin.buffer)
+    return open(path, "rb")
+
+
+def open_output(path: str) -> ContextManager[BinaryIO]:
+    """
+    Open a file for writing in binary mode, or stdout if path is "-" (which is left open afterwards).
+    """
+    if path == STDIO_PATH:
+        return nullcontext(sys.stdout.buffer)
+    return open(path, "wb")
+
+
+def is_mappable(file: BinaryIO) -> bool:
+    """
+    Only regular files can be memory-mapped (not pipes, sockets or terminals).
+    """
+    try:
+        return stat.S_ISREG(os.fstat(file.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError):  # e.g. an in-memory file without a file descriptor
+        return False
+
+
+@contextmanager
+def map_file(file: BinaryIO) -> Iterator[memoryview]:
+    """
+    Map a regular file into memory read-only and give a zero-copy view of it. Pages are only read from disk when they
+    are touched, so slicing one block out of the view does not read the rest of the file.
+    """
+    # an empty file cannot be mapped
+    if os.fstat(file.fileno()).st_size == 0:
+        yield memoryview(b"")
+        return
+
+    mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield memoryview(mapped)
+    finally:
+        # slices that are still alive (e.g. in a traceback) keep the mapping open; it is unmapped once they are collected
+        with suppress(BufferError):
+            mapped.close()